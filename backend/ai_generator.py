@@ -1,5 +1,25 @@
+import asyncio
+import contextlib
+import functools
+import hashlib
+import json
+import time
+from collections import OrderedDict
 import anthropic
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel
+from typing import List, Optional, Dict, Any, AsyncIterator, Generator, Tuple
+
+
+@functools.lru_cache(maxsize=4)
+def _get_client(api_key: str) -> anthropic.Anthropic:
+    """Shared client per API key so generators reuse one connection pool"""
+    return anthropic.Anthropic(api_key=api_key)
+
+
+@functools.lru_cache(maxsize=4)
+def _get_async_client(api_key: str) -> anthropic.AsyncAnthropic:
+    """Shared async client per API key so generators reuse one connection pool"""
+    return anthropic.AsyncAnthropic(api_key=api_key)
 
 class AIGenerator:
     """Handles interactions with Anthropic's Claude API for generating responses"""
@@ -30,8 +50,22 @@ All responses must be:
 4. **Example-supported** - Include relevant examples when they aid understanding
 Provide only the direct answer to what was asked.
 """
+
+    # Fallback replies returned when the API fails after the first round
+    PARTIAL_FAILURE_RESPONSE = "An error occurred while processing your request."
+    FINAL_FAILURE_RESPONSE = "I was unable to complete your request due to technical issues."
+
+    # Maximum number of terminal completions kept in the exact-match cache
+    COMPLETION_CACHE_SIZE = 2048
+
+    # Maximum number of conversation histories with memoized system content
+    SYSTEM_CONTENT_CACHE_SIZE = 32
+
+    # Beta that shrinks tool call output; Claude 4 models have it built in
+    TOKEN_EFFICIENT_TOOLS_BETA = "token-efficient-tools-2025-02-19"
+    TOKEN_EFFICIENT_TOOLS_MODEL_PREFIXES = ("claude-3-7-",)
     
-    def __init__(self, api_key: str, model: str):
+    def __init__(self, api_key: str, model: str, max_concurrent_requests: int = 8):
         # Validate API key before initializing client
         if not api_key:
             raise ValueError(
@@ -47,19 +81,58 @@ Provide only the direct answer to what was asked.
             )
 
         try:
-            self.client = anthropic.Anthropic(api_key=api_key)
+            self.client = _get_client(api_key)
+            self.async_client = _get_async_client(api_key)
         except Exception as e:
             raise ValueError(f"Failed to initialize Anthropic client: {str(e)}")
 
         self.model = model
 
-        # Pre-build base API parameters
-        self.base_params = {
+        # System content per conversation history, oldest first
+        self._system_content_cache: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+
+        # Bound concurrent async API calls to stay within Anthropic rate limits
+        self._request_semaphore = asyncio.Semaphore(max_concurrent_requests)
+
+        # Terminal responses keyed by a digest of the full request, oldest first
+        self._completion_cache: "OrderedDict[bytes, Any]" = OrderedDict()
+
+    @functools.cached_property
+    def base_params(self) -> Dict[str, Any]:
+        """Base API parameters, built on first request"""
+        return {
             "model": self.model,
             "temperature": 0,
             "max_tokens": 800
         }
-    
+
+    @functools.cached_property
+    def _tool_params(self) -> Dict[str, Any]:
+        """Static parameters shared by every tool-enabled request"""
+        tool_params = {
+            **self.base_params,
+            "tool_choice": {"type": "auto"}
+        }
+        
+        # Opt into token-efficient tool use where the model needs the beta
+        if self.model.startswith(self.TOKEN_EFFICIENT_TOOLS_MODEL_PREFIXES):
+            tool_params["extra_headers"] = {"anthropic-beta": self.TOKEN_EFFICIENT_TOOLS_BETA}
+        return tool_params
+
+    @functools.cached_property
+    def _cached_system_block(self) -> Dict[str, Any]:
+        """Static system prompt block marked for Anthropic prompt caching"""
+        return {
+            "type": "text",
+            "text": self.SYSTEM_PROMPT,
+            "cache_control": {"type": "ephemeral"}
+        }
+
+    @functools.cached_property
+    def _base_system_content(self) -> List[Dict[str, Any]]:
+        """System content for requests without conversation history"""
+        return [self._cached_system_block]
+
     def generate_response(self, query: str,
                          conversation_history: Optional[str] = None,
                          tools: Optional[List] = None,
@@ -78,93 +151,350 @@ Provide only the direct answer to what was asked.
             Generated response as string
         """
         
-        # Build system content efficiently - avoid string ops when possible
-        system_content = (
-            f"{self.SYSTEM_PROMPT}\n\nPrevious conversation:\n{conversation_history}"
-            if conversation_history 
-            else self.SYSTEM_PROMPT
-        )
+        rounds = self._rounds(query, conversation_history, tools, tool_manager)
+        step = next(rounds)
+        try:
+            while True:
+                action, payload = step
+                try:
+                    if action == "create":
+                        result = self._create_message(payload)
+                    else:
+                        result = [tool_manager.execute_tool(block.name, **block.input) for block in payload]
+                except Exception as e:
+                    step = rounds.throw(e)
+                else:
+                    step = rounds.send(result)
+        except StopIteration as done:
+            return done.value
+
+    async def agenerate_response(self, query: str,
+                                 conversation_history: Optional[str] = None,
+                                 tools: Optional[List] = None,
+                                 tool_manager=None) -> str:
+        """
+        Async variant of generate_response using the AsyncAnthropic client.
+        
+        Lets concurrent user queries overlap on the network instead of blocking
+        the event loop. Multiple tool calls within one round run concurrently.
+        
+        Args:
+            query: The user's question or request
+            conversation_history: Previous messages for context
+            tools: Available tools the AI can use
+            tool_manager: Manager to execute tools
+            
+        Returns:
+            Generated response as string
+        """
+        
+        rounds = self._rounds(query, conversation_history, tools, tool_manager)
+        step = next(rounds)
+        try:
+            while True:
+                action, payload = step
+                try:
+                    if action == "create":
+                        result = await self._acreate_message(payload)
+                    else:
+                        result = await asyncio.gather(*[
+                            tool_manager.aexecute_tool(block.name, **block.input) for block in payload
+                        ])
+                except Exception as e:
+                    step = rounds.throw(e)
+                else:
+                    step = rounds.send(result)
+        except StopIteration as done:
+            return done.value
+
+    async def agenerate_response_stream(self, query: str,
+                                        conversation_history: Optional[str] = None,
+                                        tools: Optional[List] = None,
+                                        tool_manager=None) -> AsyncIterator[str]:
+        """
+        Streaming variant of agenerate_response that yields text as Claude writes it.
+        
+        Rounds that offer tools run as plain requests, so text Claude writes
+        alongside a tool call never reaches the caller; their answer is yielded
+        whole. Only requests made without tools are streamed. If a stream fails
+        after part of the answer was yielded, the error is raised rather than a
+        fallback reply appended to the partial answer.
+        
+        Args:
+            query: The user's question or request
+            conversation_history: Previous messages for context
+            tools: Available tools the AI can use
+            tool_manager: Manager to execute tools
+            
+        Yields:
+            Response text deltas
+        """
+        
+        rounds = self._rounds(query, conversation_history, tools, tool_manager)
+        step = next(rounds)
+        try:
+            while True:
+                action, payload = step
+                streamed = False
+                try:
+                    if action == "run_tools":
+                        result = await asyncio.gather(*[
+                            tool_manager.aexecute_tool(block.name, **block.input) for block in payload
+                        ])
+                    elif "tools" in payload:
+                        result = await self._acreate_message(payload)
+                    else:
+                        key = self._completion_key(payload)
+                        result = self._cached_completion(key)
+                        if result is None:
+                            async with contextlib.AsyncExitStack() as stack:
+                                # Hold a request slot only while opening the stream, not while the caller reads it
+                                async with self._request_semaphore:
+                                    stream = await stack.enter_async_context(self.async_client.messages.stream(**payload))
+                                async for text in stream.text_stream:
+                                    streamed = True
+                                    yield text
+                                result = await stream.get_final_message()
+                            self._store_completion(key, result)
+                except Exception as e:
+                    # Part of the answer is already out, so a fallback reply can't replace it
+                    if streamed:
+                        raise
+                    step = rounds.throw(e)
+                else:
+                    step = rounds.send(result)
+        except StopIteration as done:
+            # A streamed answer was already yielded in deltas
+            if done.value and not streamed:
+                yield done.value
+
+    def generate_batch(self, queries: List[str],
+                       conversation_histories: Optional[List[Optional[str]]] = None,
+                       poll_interval: float = 10.0) -> List[str]:
+        """
+        Generate responses for many independent queries with the Message Batches API.
+        
+        Batches are cheaper but complete asynchronously (minutes), so this is for
+        offline workloads such as evaluation runs, not the chat path. Tools are not
+        offered since a batch can't run tool rounds.
+        
+        Args:
+            queries: The questions to answer
+            conversation_histories: Optional history per query, aligned with queries
+            poll_interval: Seconds to wait between batch status checks
+            
+        Returns:
+            Responses in query order; failed or expired entries hold FINAL_FAILURE_RESPONSE
+        
+        Raises:
+            ValueError: If conversation_histories doesn't hold one entry per query
+        """
+        if conversation_histories is not None and len(conversation_histories) != len(queries):
+            raise ValueError(
+                f"Got {len(conversation_histories)} conversation histories for {len(queries)} queries"
+            )
+        
+        if not queries:
+            return []
+        
+        histories = conversation_histories or [None] * len(queries)
+        requests = [
+            {
+                "custom_id": str(i),
+                "params": self._build_api_params(
+                    [{"role": "user", "content": query}],
+                    self._build_system_content(history)
+                )
+            }
+            for i, (query, history) in enumerate(zip(queries, histories))
+        ]
+        
+        batch = self.client.messages.batches.create(requests=requests)
+        while batch.processing_status != "ended":
+            time.sleep(poll_interval)
+            batch = self.client.messages.batches.retrieve(batch.id)
+        
+        responses = [self.FINAL_FAILURE_RESPONSE] * len(queries)
+        for entry in self.client.messages.batches.results(batch.id):
+            if entry.result.type == "succeeded":
+                responses[int(entry.custom_id)] = entry.result.message.content[0].text
+        return responses
+
+    def _rounds(self, query: str, conversation_history: Optional[str],
+                tools: Optional[List], tool_manager) -> Generator[Tuple[str, Any], Any, str]:
+        """
+        Run the tool-calling rounds of one query, leaving the API and tool calls to the caller.
+        
+        Shared by the sync, async and streaming entry points, which differ only in how
+        they make the calls. Yields ("create", api_params) and expects the response, or
+        ("run_tools", tool_use_blocks) and expects one result per block. A failed call is
+        thrown back in so the fallbacks are handled here.
+        
+        Returns:
+            The answer text
+        """
+        system_content = self._build_system_content(conversation_history)
         
         # Initialize message history for this query
         messages = [{"role": "user", "content": query}]
         max_rounds = 2
-        current_round = 0
         
-        while current_round < max_rounds:
-            # Prepare API call parameters
-            api_params = {
-                **self.base_params,
-                "messages": messages,
-                "system": system_content
-            }
+        # Messages grow in place, so the same parameters serve every round
+        api_params = self._build_api_params(messages, system_content, tools)
+        
+        for current_round in range(max_rounds):
+            try:
+                response = yield "create", api_params
+            except anthropic.APIError:
+                if current_round == 0:
+                    raise
+                # If we've made progress, return what we have so far
+                return self.PARTIAL_FAILURE_RESPONSE
+            
+            # If no tool use, return the response
+            if response.stop_reason != "tool_use":
+                return response.content[0].text
+            
+            # If tool use but no tool manager, return empty response
+            if not tool_manager:
+                return ""
             
-            # Add tools if available
-            if tools:
-                api_params["tools"] = tools
-                api_params["tool_choice"] = {"type": "auto"}
+            # Add assistant's response to message history
+            messages.append({"role": "assistant", "content": response.content})
             
             try:
-                # Get response from Claude
-                response = self.client.messages.create(**api_params)
-                
-                # If no tool use, return the response
-                if response.stop_reason != "tool_use":
-                    return response.content[0].text
-                
-                # If tool use but no tool manager, return empty response
-                if not tool_manager:
-                    return ""
-                
-                # Add assistant's response to message history
-                messages.append({"role": "assistant", "content": response.content})
+                tool_blocks = [block for block in response.content if block.type == "tool_use"]
+                results = yield "run_tools", tool_blocks
                 
-                # Execute tools and add results to message history
-                tool_results = []
-                try:
-                    for content_block in response.content:
-                        if content_block.type == "tool_use":
-                            tool_result = tool_manager.execute_tool(
-                                content_block.name, 
-                                **content_block.input
-                            )
-                            
-                            tool_results.append({
-                                "type": "tool_result",
-                                "tool_use_id": content_block.id,
-                                "content": tool_result
-                            })
-                    
-                    # Add tool results to message history
-                    if tool_results:
-                        messages.append({"role": "user", "content": tool_results})
-                    
-                except Exception as e:
-                    # Handle tool execution errors gracefully
-                    error_message = f"Tool execution failed: {str(e)}"
-                    messages.append({
-                        "role": "user", 
-                        "content": [{"type": "tool_result", "tool_use_id": "error", "content": error_message}]
-                    })
+                # Results line up with the tool_use blocks that requested them
+                tool_results = [
+                    {"type": "tool_result", "tool_use_id": block.id, "content": result}
+                    for block, result in zip(tool_blocks, results)
+                ]
                 
-                current_round += 1
+                # Add tool results to message history, caching the turn so later rounds reuse it
+                if tool_results:
+                    messages.append({"role": "user", "content": self._mark_cache_breakpoint(tool_results)})
                 
             except Exception as e:
-                # Handle API errors
-                if current_round == 0:
-                    raise e
-                # If we've made progress, return what we have so far
-                return "An error occurred while processing your request."
+                # Handle tool execution errors gracefully
+                error_message = f"Tool execution failed: {str(e)}"
+                messages.append({
+                    "role": "user", 
+                    "content": [{"type": "tool_result", "tool_use_id": "error", "content": error_message}]
+                })
         
         # If we've reached max rounds, make one final call without tools to get the answer
-        final_params = {
+        try:
+            final_response = yield "create", self._build_api_params(messages, system_content)
+        except anthropic.APIError:
+            return self.FINAL_FAILURE_RESPONSE
+        return final_response.content[0].text
+
+    def _create_message(self, api_params: Dict[str, Any]):
+        """Call messages.create, serving identical deterministic requests from the completion cache"""
+        key = self._completion_key(api_params)
+        cached = self._cached_completion(key)
+        if cached is not None:
+            return cached
+        
+        response = self.client.messages.create(**api_params)
+        self._store_completion(key, response)
+        return response
+
+    async def _acreate_message(self, api_params: Dict[str, Any]):
+        """Async variant of _create_message using the AsyncAnthropic client"""
+        key = self._completion_key(api_params)
+        cached = self._cached_completion(key)
+        if cached is not None:
+            return cached
+        
+        async with self._request_semaphore:
+            response = await self.async_client.messages.create(**api_params)
+        self._store_completion(key, response)
+        return response
+
+    def _completion_key(self, api_params: Dict[str, Any]) -> Optional[bytes]:
+        """Digest the request for the completion cache, or None if it isn't cacheable"""
+        # Only temperature 0 completions are deterministic enough to reuse
+        if api_params.get("temperature") != 0:
+            return None
+        
+        try:
+            serialized = json.dumps(api_params, sort_keys=True, default=self._to_jsonable)
+        except (TypeError, ValueError):
+            return None
+        return hashlib.blake2b(serialized.encode("utf-8"), digest_size=16).digest()
+
+    @staticmethod
+    def _to_jsonable(value: Any) -> Any:
+        """Serialize SDK content blocks echoed back in message history"""
+        if isinstance(value, BaseModel):
+            return value.model_dump()
+        raise TypeError(f"Cannot serialize {type(value).__name__} for completion cache")
+
+    def _cached_completion(self, key: Optional[bytes]):
+        """Return a cached completion and mark it recently used"""
+        if key is None:
+            return None
+        
+        cached = self._completion_cache.get(key)
+        if cached is not None:
+            self._completion_cache.move_to_end(key)
+        return cached
+
+    def _store_completion(self, key: Optional[bytes], response):
+        """Cache a terminal completion; mid-round tool_use states are never cached"""
+        if key is None or response.stop_reason == "tool_use":
+            return
+        
+        self._completion_cache[key] = response
+        while len(self._completion_cache) > self.COMPLETION_CACHE_SIZE:
+            self._completion_cache.popitem(last=False)
+
+    def _build_system_content(self, conversation_history: Optional[str]) -> List[Dict[str, Any]]:
+        """Build system content blocks for a request, reusing them for a repeated history"""
+        # The cached prompt block stays byte-identical across calls, history goes
+        # in a separate uncached block since it changes
+        if not conversation_history:
+            return self._base_system_content
+        
+        system_content = self._system_content_cache.get(conversation_history)
+        if system_content is not None:
+            self._system_content_cache.move_to_end(conversation_history)
+            return system_content
+        
+        system_content = [
+            self._cached_system_block,
+            {
+                "type": "text",
+                "text": f"Previous conversation:\n{conversation_history}"
+            }
+        ]
+        self._system_content_cache[conversation_history] = system_content
+        if len(self._system_content_cache) > self.SYSTEM_CONTENT_CACHE_SIZE:
+            self._system_content_cache.popitem(last=False)
+        return system_content
+
+    @staticmethod
+    def _mark_cache_breakpoint(blocks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Copy of blocks with the last one marked as a prompt cache breakpoint"""
+        return [*blocks[:-1], {**blocks[-1], "cache_control": {"type": "ephemeral"}}]
+
+    def _build_api_params(self, messages: List[Dict[str, Any]],
+                          system_content: List[Dict[str, Any]],
+                          tools: Optional[List] = None) -> Dict[str, Any]:
+        """Build messages.create parameters, adding tools if available"""
+        if tools:
+            return {
+                **self._tool_params,
+                "messages": messages,
+                "system": system_content,
+                "tools": self._mark_cache_breakpoint(tools)
+            }
+        
+        return {
             **self.base_params,
             "messages": messages,
             "system": system_content
         }
-        
-        try:
-            final_response = self.client.messages.create(**final_params)
-            return final_response.content[0].text
-        except Exception:
-            return "I was unable to complete your request due to technical issues."
-    
@@ -5,8 +5,10 @@ from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
+import json
 import os
 
 from config import config
@@ -56,6 +58,21 @@ class CourseStats(BaseModel):
     total_courses: int
     course_titles: List[str]
 
+def to_source_items(sources: list) -> List[SourceItem]:
+    """Convert sources from the RAG system to SourceItem objects"""
+    source_items = []
+    for source in sources:
+        if isinstance(source, dict):
+            # New format with display and link
+            source_items.append(SourceItem(
+                display=source.get('display', 'Unknown Source'),
+                link=source.get('link')
+            ))
+        else:
+            # Backwards compatibility - treat as display text only
+            source_items.append(SourceItem(display=str(source)))
+    return source_items
+
 # API Endpoints
 
 @app.post("/api/query", response_model=QueryResponse)
@@ -68,29 +85,41 @@ async def query_documents(request: QueryRequest):
             session_id = rag_system.session_manager.create_session()
         
         # Process query using RAG system
-        answer, sources = rag_system.query(request.query, session_id)
-        
-        # Convert sources to SourceItem objects
-        source_items = []
-        for source in sources:
-            if isinstance(source, dict):
-                # New format with display and link
-                source_items.append(SourceItem(
-                    display=source.get('display', 'Unknown Source'),
-                    link=source.get('link')
-                ))
-            else:
-                # Backwards compatibility - treat as display text only
-                source_items.append(SourceItem(display=str(source)))
+        answer, sources = await rag_system.aquery(request.query, session_id)
         
         return QueryResponse(
             answer=answer,
-            sources=source_items,
+            sources=to_source_items(sources),
             session_id=session_id
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/query/stream")
+async def stream_query_documents(request: QueryRequest):
+    """Process a query and stream the answer as server-sent events"""
+    # Create session if not provided
+    session_id = request.session_id
+    if not session_id:
+        session_id = rag_system.session_manager.create_session()
+    
+    async def event_stream():
+        try:
+            async for event in rag_system.astream_query(request.query, session_id):
+                if event["type"] == "sources":
+                    # Final event carries the same metadata as a QueryResponse
+                    event = {
+                        "type": "done",
+                        "sources": [item.model_dump() for item in to_source_items(event["sources"])],
+                        "session_id": session_id
+                    }
+                yield f"data: {json.dumps(event)}\n\n"
+        except Exception as e:
+            # Headers are already sent, so report failures in-band
+            yield f"data: {json.dumps({'type': 'error', 'detail': str(e)})}\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 @app.get("/api/courses", response_model=CourseStats)
 async def get_course_stats():
     """Get course analytics and statistics"""
@@ -1,11 +1,18 @@
 import os
+import re
 import sys
 from dataclasses import dataclass
+from typing import Optional
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Well-formed Anthropic keys and obvious placeholder values
+_KEY_RE = re.compile(r"sk-ant-[A-Za-z0-9\-_]{20,}")
+_PLACEHOLDER_RE = re.compile(r"your", re.IGNORECASE)
+_TEST_API_KEY = "test-api-key"
+
 @dataclass
 class Config:
     """Configuration settings for the RAG system"""
@@ -22,6 +29,10 @@ class Config:
     MAX_RESULTS: int = 5         # Maximum search results to return
     MAX_HISTORY: int = 2         # Number of conversation messages to remember
 
+    # Semantic response cache settings
+    RESPONSE_CACHE_SIZE: int = 256                   # Maximum cached responses (0 disables the cache)
+    RESPONSE_CACHE_THRESHOLD: Optional[float] = None  # Cosine similarity for semantic hits; None serves repeats only
+
     # Database paths
     CHROMA_PATH: str = "./chroma_db"  # ChromaDB storage location
 
@@ -39,8 +50,8 @@ class Config:
             )
             raise ValueError(error_msg)
 
-        # Check for proper format (Anthropic keys start with 'sk-ant-')
-        if not self.ANTHROPIC_API_KEY.startswith('sk-ant-'):
+        # Check for proper format ('sk-ant-' followed by the key body)
+        if not _KEY_RE.fullmatch(self.ANTHROPIC_API_KEY):
             error_msg = (
                 "\n⚠️  WARNING: API key format appears incorrect.\n"
                 "Anthropic API keys should start with 'sk-ant-'.\n"
@@ -49,7 +60,7 @@ class Config:
             print(error_msg, file=sys.stderr)
 
         # Check for placeholder or test values
-        if 'your' in self.ANTHROPIC_API_KEY.lower() or self.ANTHROPIC_API_KEY == 'test-api-key':
+        if _PLACEHOLDER_RE.search(self.ANTHROPIC_API_KEY) or self.ANTHROPIC_API_KEY == _TEST_API_KEY:
             error_msg = (
                 "\n❌ ERROR: Invalid API key detected!\n"
                 "Please replace the placeholder with your actual Anthropic API key.\n"
@@ -1,12 +1,20 @@
-from typing import List, Tuple, Optional, Dict
+from typing import List, Tuple, Optional, Dict, Any, AsyncIterator
+import asyncio
 import os
 from document_processor import DocumentProcessor
 from vector_store import VectorStore
 from ai_generator import AIGenerator
 from session_manager import SessionManager
 from search_tools import ToolManager, CourseSearchTool
+from semantic_cache import SemanticCache
 from models import Course, Lesson, CourseChunk
 
+# Course document types picked up when loading a folder
+SUPPORTED_DOCUMENT_EXTENSIONS = frozenset({'.pdf', '.docx', '.txt'})
+
+# Fallback replies AIGenerator returns when the API fails; answers containing one are never cached
+FAILURE_RESPONSES = (AIGenerator.PARTIAL_FAILURE_RESPONSE, AIGenerator.FINAL_FAILURE_RESPONSE)
+
 class RAGSystem:
     """Main orchestrator for the Retrieval-Augmented Generation system"""
     
@@ -19,6 +27,13 @@ class RAGSystem:
         self.ai_generator = AIGenerator(config.ANTHROPIC_API_KEY, config.ANTHROPIC_MODEL)
         self.session_manager = SessionManager(config.MAX_HISTORY)
         
+        # Cache answers for semantically equivalent questions, reusing the store's embedding model
+        self.response_cache = SemanticCache(
+            self.vector_store.embedding_function,
+            config.RESPONSE_CACHE_THRESHOLD,
+            config.RESPONSE_CACHE_SIZE
+        )
+        
         # Initialize search tools
         self.tool_manager = ToolManager()
         self.search_tool = CourseSearchTool(self.vector_store)
@@ -44,6 +59,9 @@ class RAGSystem:
             # Add course content chunks to vector store
             self.vector_store.add_course_content(course_chunks)
             
+            # Cached answers may be stale once new content is searchable
+            self.response_cache.clear()
+            
             return course, len(course_chunks)
         except Exception as e:
             print(f"Error processing course document {file_path}: {e}")
@@ -67,36 +85,39 @@ class RAGSystem:
         if clear_existing:
             print("Clearing existing data for fresh rebuild...")
             self.vector_store.clear_all_data()
+            self.response_cache.clear()
         
         if not os.path.exists(folder_path):
             print(f"Folder {folder_path} does not exist")
             return 0, 0
         
-        # Get existing course titles to avoid re-processing
-        existing_course_titles = set(self.vector_store.get_existing_course_titles())
-        
-        # Process each file in the folder
-        for file_name in os.listdir(folder_path):
-            file_path = os.path.join(folder_path, file_name)
-            if os.path.isfile(file_path) and file_name.lower().endswith(('.pdf', '.docx', '.txt')):
-                try:
-                    # Check if this course might already exist
-                    # We'll process the document to get the course ID, but only add if new
-                    course, course_chunks = self.document_processor.process_course_document(file_path)
-                    
-                    if course and course.title not in existing_course_titles:
-                        # This is a new course - add it to the vector store
-                        self.vector_store.add_course_metadata(course)
-                        self.vector_store.add_course_content(course_chunks)
-                        total_courses += 1
-                        total_chunks += len(course_chunks)
-                        print(f"Added new course: {course.title} ({len(course_chunks)} chunks)")
-                        existing_course_titles.add(course.title)
-                    elif course:
-                        print(f"Course already exists: {course.title} - skipping")
-                except Exception as e:
-                    print(f"Error processing {file_name}: {e}")
+        # scandir entries cache their file type, so filtering costs no extra stat calls
+        with os.scandir(folder_path) as entries:
+            document_entries = [
+                entry for entry in entries
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in SUPPORTED_DOCUMENT_EXTENSIONS
+            ]
         
+        # Process each document in the folder
+        for entry in document_entries:
+            try:
+                # Check if this course might already exist
+                # We'll process the document to get the course ID, but only add if new
+                course, course_chunks = self.document_processor.process_course_document(entry.path)
+                
+                if course and not self.vector_store.has_course(course.title):
+                    # This is a new course - add it to the vector store
+                    self.vector_store.add_course_metadata(course)
+                    self.vector_store.add_course_content(course_chunks)
+                    total_courses += 1
+                    total_chunks += len(course_chunks)
+                    print(f"Added new course: {course.title} ({len(course_chunks)} chunks)")
+                    self.response_cache.clear()
+                elif course:
+                    print(f"Course already exists: {course.title} - skipping")
+            except Exception as e:
+                print(f"Error processing {entry.name}: {e}")
+    
         return total_courses, total_chunks
     
     def query(self, query: str, session_id: Optional[str] = None) -> Tuple[str, List[str]]:
@@ -118,19 +139,26 @@ class RAGSystem:
         if session_id:
             history = self.session_manager.get_conversation_history(session_id)
         
-        # Generate response using AI with tools
-        response = self.ai_generator.generate_response(
-            query=prompt,
-            conversation_history=history,
-            tools=self.tool_manager.get_tool_definitions(),
-            tool_manager=self.tool_manager
-        )
-        
-        # Get sources from the search tool
-        sources = self.tool_manager.get_last_sources()
+        # Serve semantically equivalent questions from the cache without calling Claude
+        cached = self.response_cache.lookup(query, history)
+        if cached is not None:
+            response, sources = cached
+        else:
+            # Generate response using AI with tools
+            response = self.ai_generator.generate_response(
+                query=prompt,
+                conversation_history=history,
+                tools=self.tool_manager.get_tool_definitions(),
+                tool_manager=self.tool_manager
+            )
+            
+            # Get sources from the search tool
+            sources = self.tool_manager.get_last_sources()
 
-        # Reset sources after retrieving them
-        self.tool_manager.reset_sources()
+            # Reset sources after retrieving them
+            self.tool_manager.reset_sources()
+            
+            self._cache_response(query, history, response, sources)
         
         # Update conversation history
         if session_id:
@@ -138,7 +166,102 @@ class RAGSystem:
         
         # Return response with sources from tool searches
         return response, sources
-    
+
+    async def aquery(self, query: str, session_id: Optional[str] = None) -> Tuple[str, List[str]]:
+        """
+        Async variant of query that doesn't block the event loop while Claude responds.
+
+        Args:
+            query: User's question
+            session_id: Optional session ID for conversation context
+
+        Returns:
+            Tuple of (response, sources list)
+        """
+        prompt = f"""Answer this question about course materials: {query}"""
+
+        history = None
+        if session_id:
+            history = self.session_manager.get_conversation_history(session_id)
+
+        # The cache embeds the query, so keep it off the event loop
+        cached = await asyncio.to_thread(self.response_cache.lookup, query, history)
+        if cached is not None:
+            response, sources = cached
+        else:
+            # Use a per-request tool manager so concurrent queries don't share last_sources
+            tool_manager = ToolManager()
+            tool_manager.register_tool(CourseSearchTool(self.vector_store))
+
+            response = await self.ai_generator.agenerate_response(
+                query=prompt,
+                conversation_history=history,
+                tools=tool_manager.get_tool_definitions(),
+                tool_manager=tool_manager
+            )
+
+            sources = tool_manager.get_last_sources()
+
+            await asyncio.to_thread(self._cache_response, query, history, response, sources)
+
+        if session_id:
+            self.session_manager.add_exchange(session_id, query, response)
+
+        return response, sources
+
+    async def astream_query(self, query: str, session_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of aquery that yields the answer while it is generated.
+
+        Args:
+            query: User's question
+            session_id: Optional session ID for conversation context
+
+        Yields:
+            {"type": "text", "text": ...} events for answer deltas, then one
+            {"type": "sources", "sources": [...]} event once the answer is complete
+        """
+        prompt = f"""Answer this question about course materials: {query}"""
+
+        history = None
+        if session_id:
+            history = self.session_manager.get_conversation_history(session_id)
+
+        cached = await asyncio.to_thread(self.response_cache.lookup, query, history)
+        if cached is not None:
+            response, sources = cached
+            yield {"type": "text", "text": response}
+        else:
+            tool_manager = ToolManager()
+            tool_manager.register_tool(CourseSearchTool(self.vector_store))
+
+            chunks = []
+            async for text in self.ai_generator.agenerate_response_stream(
+                query=prompt,
+                conversation_history=history,
+                tools=tool_manager.get_tool_definitions(),
+                tool_manager=tool_manager
+            ):
+                chunks.append(text)
+                yield {"type": "text", "text": text}
+
+            response = "".join(chunks)
+            sources = tool_manager.get_last_sources()
+
+            await asyncio.to_thread(self._cache_response, query, history, response, sources)
+
+        if session_id:
+            self.session_manager.add_exchange(session_id, query, response)
+
+        yield {"type": "sources", "sources": sources}
+
+    def _cache_response(self, query: str, history: Optional[str], response: str, sources: List):
+        """Cache a generated answer unless it is empty or contains an API failure fallback"""
+        # A streamed answer can end in a fallback after part of it was already sent
+        if not response or any(failure in response for failure in FAILURE_RESPONSES):
+            return
+        self.response_cache.insert(query, history, (response, sources))
+
     def get_course_analytics(self) -> Dict:
         """Get analytics about the course catalog"""
         return {
@@ -1,3 +1,4 @@
+import asyncio
 from typing import Dict, Any, Optional, Protocol
 from abc import ABC, abstractmethod
 from vector_store import VectorStore, SearchResults
@@ -90,7 +91,7 @@ class CourseSearchTool(Tool):
         formatted = []
         sources = []  # Track sources for the UI with links
         
-        for doc, meta in zip(results.documents, results.metadata):
+        for doc, meta, _ in results.iter_results():
             course_title = meta.get('course_title', 'unknown')
             lesson_num = meta.get('lesson_number')
             
@@ -149,6 +150,10 @@ class ToolManager:
             return f"Tool '{tool_name}' not found"
         
         return self.tools[tool_name].execute(**kwargs)
+
+    async def aexecute_tool(self, tool_name: str, **kwargs) -> str:
+        """Execute a tool by name in a worker thread so sync tools don't block the event loop"""
+        return await asyncio.to_thread(self.execute_tool, tool_name, **kwargs)
     
     def get_last_sources(self) -> list:
         """Get sources from the last search operation"""
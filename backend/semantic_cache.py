@@ -0,0 +1,127 @@
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Numbers in a question, e.g. lesson numbers; similar questions about different ones need different answers
+_NUMBER_RE = re.compile(r"\d+")
+
+
+class SemanticCache:
+    """In-memory response cache keyed on the normalized question and conversation history
+
+    Only repeated questions (ignoring case and whitespace) are served by default. With a
+    threshold, a question whose embedding is at least that similar to a cached one is
+    also served, unless the numbers in the two questions differ. Embeddings can't tell
+    apart e.g. "lesson 1" and "lesson 2" of a course, or two courses with similar names,
+    so the semantic path is opt-in.
+    """
+
+    def __init__(self, embedding_function: Callable, threshold: Optional[float] = None, max_entries: int = 256):
+        self.embedding_function = embedding_function
+        self.threshold = threshold
+        self.max_entries = max_entries
+        # (history key, normalized query) -> (normalized query embedding or None, cached value), oldest first
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[Optional[np.ndarray], Any]]" = OrderedDict()
+        # Async queries look up and insert on worker threads; embedding runs outside the lock
+        self._lock = threading.Lock()
+        # Embedding of the last looked-up query, reused by insert after a miss
+        self._last_embedding: Optional[Tuple[str, np.ndarray]] = None
+
+    def lookup(self, query: str, conversation_history: Optional[str] = None) -> Optional[Any]:
+        """
+        Find a cached value for a repeated, or semantically equivalent, query in the same conversation context.
+
+        Args:
+            query: The user's question
+            conversation_history: Formatted history the answer was generated with
+
+        Returns:
+            Cached value, or None on a miss
+        """
+        if self.max_entries <= 0:
+            return None
+
+        history_key = self._history_key(conversation_history)
+        normalized = self._normalize(query)
+
+        with self._lock:
+            # Exact repeats skip the embedding entirely
+            exact = self._entries.get((history_key, normalized))
+            if exact is not None:
+                return exact[1]
+            if self.threshold is None:
+                return None
+
+            # Only compare against entries generated with the same conversation context and numbers
+            numbers = _NUMBER_RE.findall(normalized)
+            candidates = [
+                entry for (key, cached_query), entry in self._entries.items()
+                if key == history_key and _NUMBER_RE.findall(cached_query) == numbers
+            ]
+        if not candidates:
+            return None
+
+        try:
+            query_embedding = self._embed(query)
+        except Exception as e:
+            logger.warning("Error embedding query for response cache: %s", e)
+            return None
+
+        similarities = np.stack([embedding for embedding, _ in candidates]) @ query_embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.threshold:
+            return candidates[best][1]
+        return None
+
+    def insert(self, query: str, conversation_history: Optional[str], value: Any):
+        """Cache a value for a query, evicting the oldest entries beyond max_entries"""
+        if self.max_entries <= 0:
+            return
+
+        query_embedding = None
+        if self.threshold is not None:
+            try:
+                query_embedding = self._embed(query)
+            except Exception as e:
+                logger.warning("Error embedding query for response cache: %s", e)
+                return
+
+        key = (self._history_key(conversation_history), self._normalize(query))
+        with self._lock:
+            self._entries[key] = (query_embedding, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all cached entries"""
+        with self._lock:
+            self._entries.clear()
+            self._last_embedding = None
+
+    def _embed(self, query: str) -> np.ndarray:
+        """Embed and L2-normalize a query so a dot product gives cosine similarity"""
+        # Read the shared pair once; another thread may replace it at any point
+        last = self._last_embedding
+        if last is not None and last[0] == query:
+            return last[1]
+
+        embedding = np.asarray(self.embedding_function([query])[0], dtype=np.float32)
+        embedding = embedding / (np.linalg.norm(embedding) or 1.0)
+        self._last_embedding = (query, embedding)
+        return embedding
+
+    @staticmethod
+    def _normalize(query: str) -> str:
+        """Key repeated questions regardless of case and spacing"""
+        return " ".join(query.casefold().split())
+
+    @staticmethod
+    def _history_key(conversation_history: Optional[str]) -> int:
+        """Key conversation context so multi-turn answers aren't mixed"""
+        return hash(conversation_history or "")
@@ -1,32 +1,42 @@
 """
 Pytest configuration and fixtures for RAG system tests.
 """
-import pytest
-import sys
 import os
-from unittest.mock import Mock, MagicMock, patch
-from typing import List, Dict, Any
-
-# Add the backend directory to Python path so we can import modules
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import anthropic
+import httpx
+import pytest
+from unittest.mock import Mock, patch
+from typing import Dict, Any
 
 from config import Config
-from models import Course, Lesson, CourseChunk
-from vector_store import VectorStore, SearchResults
+from vector_store import VectorStore
 from search_tools import CourseSearchTool, ToolManager
+import ai_generator
+import vector_store
 from ai_generator import AIGenerator
-from rag_system import RAGSystem
-from .fixtures import MockTestData, MockChromaResponse, MockAnthropicResponse
+from .fixtures import (
+    MockTestData, MockChromaResponse, MockAnthropicClient, MockAsyncAnthropicClient, StubToolManager, FakeCollection,
+    TOOL_USE_RESP, FINAL_RESP, ANTHROPIC_TEXT_MESSAGE
+)
 
+# Captured before the module patch replaces the SDK classes with mocks
+_REAL_ASYNC_ANTHROPIC = anthropic.AsyncAnthropic
 
-@pytest.fixture
-def test_config():
-    """Test configuration with safe defaults"""
-    config = Config()
-    config.ANTHROPIC_API_KEY = "test-api-key"
-    config.CHROMA_PATH = ":memory:"  # In-memory database for tests
-    config.MAX_RESULTS = 3
-    return config
+
+def pytest_collection_modifyitems(config, items):
+    """Skip integration tests unless a real Anthropic API key is available"""
+    if os.environ.get("ANTHROPIC_API_KEY"):
+        return
+    skip_integration = pytest.mark.skip(reason="ANTHROPIC_API_KEY not set")
+    for item in items:
+        if "integration" in item.keywords:
+            item.add_marker(skip_integration)
+
+
+@pytest.fixture(scope="module")
+def config():
+    """Config with a test API key, shared by a module; copy with dataclasses.replace to change it"""
+    return Config(ANTHROPIC_API_KEY="test-key")
 
 
 @pytest.fixture
@@ -47,12 +57,19 @@ def sample_search_results():
     return MockTestData.get_sample_search_results()
 
 
+@pytest.fixture(scope="module")
+def _vector_store_mock():
+    """One spec'd VectorStore mock per module, reset between tests instead of rebuilt"""
+    return Mock(spec=VectorStore)
+
+
 @pytest.fixture
-def mock_vector_store():
+def mock_vector_store(_vector_store_mock):
     """Mock VectorStore for unit testing"""
-    mock_store = Mock(spec=VectorStore)
+    mock_store = _vector_store_mock
+    mock_store.reset_mock(return_value=True, side_effect=True)
     
-    # Configure default behavior
+    # Default payload for every test; tests wanting other results override search.return_value
     mock_store.search.return_value = MockTestData.get_sample_search_results()
     mock_store.get_lesson_link.return_value = "https://example.com/lesson3"
     mock_store.get_existing_course_titles.return_value = ["Advanced Python Programming", "Machine Learning Fundamentals"]
@@ -79,15 +96,11 @@ def mock_vector_store_error():
 @pytest.fixture
 def mock_chroma_client():
     """Mock ChromaDB client"""
-    mock_client = MagicMock()
-    
-    # Mock collections
-    mock_course_catalog = MagicMock()
-    mock_course_content = MagicMock()
+    mock_client = Mock()
     
-    # Configure collection responses
-    mock_course_catalog.query.return_value = MockChromaResponse.course_catalog_response()
-    mock_course_content.query.return_value = MockChromaResponse.successful_query_response()
+    # Fake collections with their query responses
+    mock_course_catalog = FakeCollection(query_result=MockChromaResponse.course_catalog_response())
+    mock_course_content = FakeCollection(query_result=MockChromaResponse.successful_query_response())
     
     # Configure client to return mock collections
     mock_client.get_or_create_collection.side_effect = lambda name, **kwargs: (
@@ -97,21 +110,91 @@ def mock_chroma_client():
     return mock_client
 
 
+@pytest.fixture(autouse=True, scope="module")
+def _patch_anthropic(request):
+    """Patch the Anthropic client classes once per module, except in integration modules"""
+    # Live tests must reach the real API, so they keep the SDK classes
+    if request.node.get_closest_marker("integration"):
+        yield None
+        return
+    # Plain Mock classes: nothing needs MagicMock's magic method support
+    with patch('ai_generator.anthropic.Anthropic', new_callable=Mock) as anthropic_class, \
+         patch('ai_generator.anthropic.AsyncAnthropic', new_callable=Mock) as async_anthropic_class:
+        yield anthropic_class, async_anthropic_class
+
+
 @pytest.fixture
-def mock_anthropic_client():
-    """Mock Anthropic client"""
-    mock_client = Mock()
-    
-    # Configure messages.create to return different responses based on context
-    mock_client.messages.create.return_value = MockAnthropicResponse.direct_response()
-    
+def anthropic_cls(_patch_anthropic, fresh_anthropic_clients):
+    """Patched Anthropic class with its calls and return value reset for this test"""
+    anthropic_class = _patch_anthropic[0]
+    anthropic_class.reset_mock(return_value=True, side_effect=True)
+    return anthropic_class
+
+
+@pytest.fixture
+def async_anthropic_cls(_patch_anthropic, fresh_anthropic_clients):
+    """Patched AsyncAnthropic class with its calls and return value reset for this test"""
+    async_anthropic_class = _patch_anthropic[1]
+    async_anthropic_class.reset_mock(return_value=True, side_effect=True)
+    return async_anthropic_class
+
+
+@pytest.fixture
+def mock_client(anthropic_cls):
+    """Fresh MockAnthropicClient per test, handed out by the patched Anthropic class
+
+    Kept function-scoped so call counts never leak between tests, which keeps
+    the suite safe to run in parallel with pytest-xdist.
+    """
+    client = MockAnthropicClient()
+    anthropic_cls.return_value = client
+    return client
+
+
+@pytest.fixture
+def generator(mock_client):
+    """AIGenerator wired to the test's MockAnthropicClient"""
+    return AIGenerator("test-api-key", "claude-3-sonnet")
+
+
+@pytest.fixture
+def mock_async_client(async_anthropic_cls):
+    """Fresh MockAsyncAnthropicClient handed out by the patched AsyncAnthropic class"""
+    client = MockAsyncAnthropicClient()
+    async_anthropic_cls.return_value = client
+    return client
+
+
+@pytest.fixture
+def async_generator(mock_client, mock_async_client):
+    """AIGenerator wired to the test's sync and async mock clients"""
+    return AIGenerator("test-api-key", "claude-3-sonnet")
+
+
+@pytest.fixture
+def tool_flow_client(mock_client):
+    """MockAnthropicClient primed with a tool_use response followed by the final answer"""
+    mock_client.set_responses([TOOL_USE_RESP, FINAL_RESP])
     return mock_client
 
 
 @pytest.fixture
-def course_search_tool(mock_vector_store):
+def mock_tool_manager():
+    """Stub ToolManager whose tools all return a fixed result"""
+    return StubToolManager("Tool result")
+
+
+@pytest.fixture(scope="module")
+def _course_search_tool(_vector_store_mock):
+    """One CourseSearchTool per module over the shared VectorStore mock"""
+    return CourseSearchTool(_vector_store_mock)
+
+
+@pytest.fixture
+def course_search_tool(_course_search_tool, mock_vector_store):
     """CourseSearchTool with mock vector store"""
-    return CourseSearchTool(mock_vector_store)
+    _course_search_tool.last_sources = []
+    return _course_search_tool
 
 
 @pytest.fixture
@@ -126,29 +209,44 @@ def course_search_tool_error(mock_vector_store_error):
     return CourseSearchTool(mock_vector_store_error)
 
 
-@pytest.fixture
-def tool_manager(course_search_tool):
-    """ToolManager with registered CourseSearchTool"""
+@pytest.fixture(scope="module")
+def _tool_manager(_course_search_tool):
+    """One ToolManager per module with the shared CourseSearchTool registered"""
     manager = ToolManager()
-    manager.register_tool(course_search_tool)
+    manager.register_tool(_course_search_tool)
     return manager
 
 
 @pytest.fixture
-def mock_ai_generator(mock_anthropic_client):
-    """Mock AIGenerator for testing"""
-    with patch('ai_generator.anthropic.Anthropic', return_value=mock_anthropic_client):
-        generator = AIGenerator("test-api-key", "claude-3-sonnet")
-        return generator
+def tool_manager(_tool_manager, course_search_tool):
+    """ToolManager with registered CourseSearchTool"""
+    # Drop anything a previous test registered on the shared manager
+    _tool_manager.tools = {"search_course_content": course_search_tool}
+    return _tool_manager
 
 
 @pytest.fixture
-def mock_rag_system(test_config, mock_vector_store, mock_ai_generator):
-    """Mock RAGSystem for integration testing"""
-    with patch('rag_system.VectorStore', return_value=mock_vector_store), \
-         patch('rag_system.AIGenerator', return_value=mock_ai_generator):
-        system = RAGSystem(test_config)
-        return system
+def anthropic_http_client():
+    """Build real AsyncAnthropic clients whose HTTP requests are answered in-process"""
+    def build(status_code: int = 200, body: Dict[str, Any] = ANTHROPIC_TEXT_MESSAGE):
+        transport = httpx.MockTransport(lambda request: httpx.Response(status_code, json=body))
+        return _REAL_ASYNC_ANTHROPIC(
+            api_key="test-api-key",
+            max_retries=0,
+            http_client=httpx.AsyncClient(transport=transport)
+        )
+    return build
+
+
+@pytest.fixture(scope="session")
+def shared_embedding_function():
+    """Real embedding function loaded once per session, or None if the model is unavailable"""
+    from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+    try:
+        return SentenceTransformerEmbeddingFunction(model_name=Config.EMBEDDING_MODEL)
+    except Exception as e:
+        print(f"Embedding model failed to load: {e}")
+        return None
 
 
 # Test data constants
@@ -159,21 +257,16 @@ COURSE_FILTER_QUERY = "machine learning basics"
 INVALID_COURSE_QUERY = "nonexistent course content"
 
 
-@pytest.fixture(autouse=True)
-def setup_test_environment():
-    """Setup test environment for each test"""
-    # Clear any existing environment variables that might interfere
-    if 'ANTHROPIC_API_KEY' in os.environ:
-        original_key = os.environ['ANTHROPIC_API_KEY']
-    else:
-        original_key = None
-        
-    os.environ['ANTHROPIC_API_KEY'] = 'test-key'
-    
+@pytest.fixture
+def fresh_anthropic_clients():
+    """Drop shared Anthropic clients so a test sees its own patched client"""
+    ai_generator._get_client.cache_clear()
+    ai_generator._get_async_client.cache_clear()
+
+
+@pytest.fixture
+def fresh_embedding_functions():
+    """Drop shared embedding functions so a test sees its own patched one, and leaves none behind"""
+    vector_store._get_embedding_function.cache_clear()
     yield
-    
-    # Restore original environment
-    if original_key:
-        os.environ['ANTHROPIC_API_KEY'] = original_key
-    else:
-        os.environ.pop('ANTHROPIC_API_KEY', None)
\ No newline at end of file
+    vector_store._get_embedding_function.cache_clear()
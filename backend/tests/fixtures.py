@@ -1,83 +1,106 @@
 """
 Test fixtures and sample data for RAG system tests.
 """
+import itertools
 import json
+from dataclasses import dataclass
+from types import SimpleNamespace
 from typing import List, Dict, Any
+from unittest.mock import Mock
 from models import Course, Lesson, CourseChunk
+from search_tools import Tool
 from vector_store import SearchResults
 
 
+# Sample search hits shared by every get_sample_search_results call
+_SAMPLE_SEARCH_DOCUMENTS = (
+    "Python decorators are a powerful feature that allows you to modify or enhance functions without changing their code directly.",
+    "A closure is a function that captures variables from its enclosing scope, allowing access to those variables even after the outer function returns."
+)
+_SAMPLE_SEARCH_METADATA = (
+    {"course_title": "Advanced Python Programming", "lesson_number": 3, "chunk_index": 0},
+    {"course_title": "Advanced Python Programming", "lesson_number": 3, "chunk_index": 1}
+)
+_SAMPLE_SEARCH_DISTANCES = (0.1, 0.2)
+
+# Serialized lessons for the course catalog response, encoded once at import
+_LESSONS_JSON = json.dumps([
+    {"lesson_number": 1, "title": "Introduction to Python", "lesson_link": "https://example.com/lesson1"},
+    {"lesson_number": 3, "title": "Decorators and Closures", "lesson_link": "https://example.com/lesson3"}
+])
+
+
+# Sample courses and chunks, built once; tests only read the model instances
+_SAMPLE_COURSES = (
+    Course(
+        title="Advanced Python Programming",
+        instructor="Sarah Chen", 
+        course_link="https://example.com/python-course",
+        lessons=[
+            Lesson(lesson_number=1, title="Introduction to Python", lesson_link="https://example.com/lesson1"),
+            Lesson(lesson_number=2, title="Data Structures", lesson_link="https://example.com/lesson2"),
+            Lesson(lesson_number=3, title="Decorators and Closures", lesson_link="https://example.com/lesson3"),
+        ]
+    ),
+    Course(
+        title="Machine Learning Fundamentals",
+        instructor="Dr. Alex Rodriguez",
+        course_link="https://example.com/ml-course", 
+        lessons=[
+            Lesson(lesson_number=1, title="Introduction to ML", lesson_link="https://example.com/ml-lesson1"),
+            Lesson(lesson_number=2, title="Linear Regression", lesson_link="https://example.com/ml-lesson2"),
+        ]
+    )
+)
+_SAMPLE_COURSE_CHUNKS = (
+    CourseChunk(
+        content="Python decorators are a powerful feature that allows you to modify or enhance functions without changing their code directly.",
+        course_title="Advanced Python Programming", 
+        lesson_number=3,
+        chunk_index=0
+    ),
+    CourseChunk(
+        content="A closure is a function that captures variables from its enclosing scope, allowing access to those variables even after the outer function returns.",
+        course_title="Advanced Python Programming",
+        lesson_number=3, 
+        chunk_index=1
+    ),
+    CourseChunk(
+        content="Machine learning is a subset of artificial intelligence that focuses on algorithms that can learn from and make predictions on data.",
+        course_title="Machine Learning Fundamentals",
+        lesson_number=1,
+        chunk_index=0
+    ),
+    CourseChunk(
+        content="Linear regression is a fundamental algorithm used to model the relationship between a dependent variable and independent variables.",
+        course_title="Machine Learning Fundamentals",
+        lesson_number=2,
+        chunk_index=0
+    )
+)
+
+
 class MockTestData:
     """Container for mock test data"""
     
     @staticmethod
     def get_sample_courses() -> List[Course]:
         """Get sample course data for testing"""
-        return [
-            Course(
-                title="Advanced Python Programming",
-                instructor="Sarah Chen", 
-                course_link="https://example.com/python-course",
-                lessons=[
-                    Lesson(lesson_number=1, title="Introduction to Python", lesson_link="https://example.com/lesson1"),
-                    Lesson(lesson_number=2, title="Data Structures", lesson_link="https://example.com/lesson2"),
-                    Lesson(lesson_number=3, title="Decorators and Closures", lesson_link="https://example.com/lesson3"),
-                ]
-            ),
-            Course(
-                title="Machine Learning Fundamentals",
-                instructor="Dr. Alex Rodriguez",
-                course_link="https://example.com/ml-course", 
-                lessons=[
-                    Lesson(lesson_number=1, title="Introduction to ML", lesson_link="https://example.com/ml-lesson1"),
-                    Lesson(lesson_number=2, title="Linear Regression", lesson_link="https://example.com/ml-lesson2"),
-                ]
-            )
-        ]
+        return list(_SAMPLE_COURSES)
     
     @staticmethod
     def get_sample_course_chunks() -> List[CourseChunk]:
         """Get sample course chunks for testing"""
-        return [
-            CourseChunk(
-                content="Python decorators are a powerful feature that allows you to modify or enhance functions without changing their code directly.",
-                course_title="Advanced Python Programming", 
-                lesson_number=3,
-                chunk_index=0
-            ),
-            CourseChunk(
-                content="A closure is a function that captures variables from its enclosing scope, allowing access to those variables even after the outer function returns.",
-                course_title="Advanced Python Programming",
-                lesson_number=3, 
-                chunk_index=1
-            ),
-            CourseChunk(
-                content="Machine learning is a subset of artificial intelligence that focuses on algorithms that can learn from and make predictions on data.",
-                course_title="Machine Learning Fundamentals",
-                lesson_number=1,
-                chunk_index=0
-            ),
-            CourseChunk(
-                content="Linear regression is a fundamental algorithm used to model the relationship between a dependent variable and independent variables.",
-                course_title="Machine Learning Fundamentals",
-                lesson_number=2,
-                chunk_index=0
-            )
-        ]
+        return list(_SAMPLE_COURSE_CHUNKS)
     
     @staticmethod
     def get_sample_search_results() -> SearchResults:
         """Get sample search results for testing"""
+        # Fresh containers so a test mutating its results can't affect others
         return SearchResults(
-            documents=[
-                "Python decorators are a powerful feature that allows you to modify or enhance functions without changing their code directly.",
-                "A closure is a function that captures variables from its enclosing scope, allowing access to those variables even after the outer function returns."
-            ],
-            metadata=[
-                {"course_title": "Advanced Python Programming", "lesson_number": 3, "chunk_index": 0},
-                {"course_title": "Advanced Python Programming", "lesson_number": 3, "chunk_index": 1}
-            ],
-            distances=[0.1, 0.2]
+            documents=list(_SAMPLE_SEARCH_DOCUMENTS),
+            metadata=[dict(meta) for meta in _SAMPLE_SEARCH_METADATA],
+            distances=list(_SAMPLE_SEARCH_DISTANCES)
         )
     
     @staticmethod
@@ -127,60 +150,279 @@ class MockChromaResponse:
                 "title": "Advanced Python Programming",
                 "instructor": "Sarah Chen",
                 "course_link": "https://example.com/python-course",
-                "lessons_json": json.dumps([
-                    {"lesson_number": 1, "title": "Introduction to Python", "lesson_link": "https://example.com/lesson1"},
-                    {"lesson_number": 3, "title": "Decorators and Closures", "lesson_link": "https://example.com/lesson3"}
-                ]),
+                "lessons_json": _LESSONS_JSON,
                 "lesson_count": 3
             }]],
             'distances': [[0.0]]
         }
 
 
+@dataclass(slots=True)
+class MockResponse:
+    """Mock Anthropic message with content blocks and a stop reason"""
+    content: list
+    stop_reason: str
+
+
 class MockAnthropicResponse:
     """Mock Anthropic API response data"""
     
     @staticmethod
     def direct_response():
         """Mock direct response without tool use"""
-        class MockResponse:
-            def __init__(self):
-                self.content = [MockContent("This is a direct response to your query about Python programming.")]
-                self.stop_reason = "end_turn"
-        
-        return MockResponse()
+        return MockResponse(
+            content=[MockContent("This is a direct response to your query about Python programming.")],
+            stop_reason="end_turn"
+        )
     
     @staticmethod
     def tool_use_response():
         """Mock response with tool use"""
-        class MockResponse:
-            def __init__(self):
-                self.content = [MockToolUse()]
-                self.stop_reason = "tool_use"
-        
-        return MockResponse()
+        return MockResponse(content=[MockToolUse()], stop_reason="tool_use")
+    
+    @staticmethod
+    def preamble_tool_use_response():
+        """Mock tool use response that writes some text before the tool call"""
+        return MockResponse(
+            content=[MockContent("Let me search the course materials."), MockToolUse()],
+            stop_reason="tool_use"
+        )
     
     @staticmethod  
     def final_response_after_tool():
         """Mock final response after tool execution"""
-        class MockResponse:
-            def __init__(self):
-                self.content = [MockContent("Based on the search results, Python decorators are a powerful feature for enhancing functions.")]
-                self.stop_reason = "end_turn"
+        return MockResponse(
+            content=[MockContent("Based on the search results, Python decorators are a powerful feature for enhancing functions.")],
+            stop_reason="end_turn"
+        )
+    
+    @staticmethod
+    def multi_tool_use_response():
+        """Mock response requesting two tool calls in one round"""
+        return MockResponse(
+            content=[MockToolUse(), MockToolUse("tool_654321")],
+            stop_reason="tool_use"
+        )
+    
+    @staticmethod
+    def malformed_tool_response():
+        """Mock tool use response whose content block lacks tool use attributes"""
+        return MockResponse(content=[Mock()], stop_reason="tool_use")
+
+
+class MockAnthropicClient:
+    """Enhanced mock for Anthropic client with configurable responses"""
+    
+    def __init__(self):
+        # A plain namespace avoids Mock's dynamic attribute machinery on every call
+        self.messages = SimpleNamespace(create=self.create_response)
+        self.set_responses(())
+        
+    def set_responses(self, responses):
+        """Set a sequence of responses for subsequent calls, then fall back to DIRECT_RESP"""
+        self._responses = itertools.chain(responses, itertools.repeat(DIRECT_RESP))
+        self.call_args_list = []
+        self.tool_result_messages = []
+    
+    @property
+    def call_count(self) -> int:
+        return len(self.call_args_list)
+    
+    @property
+    def last_kwargs(self):
+        return self.call_args_list[-1] if self.call_args_list else None
+        
+    def create_response(self, **kwargs):
+        """Mock messages.create method"""
+        # Store call arguments for inspection
+        self.call_args_list.append(kwargs)
+        # Tool results are always the newest message when a tool round is sent back
+        messages = kwargs.get("messages")
+        if messages and messages[-1]["role"] == "user" and isinstance(messages[-1]["content"], list):
+            self.tool_result_messages.append(messages[-1])
+        return next(self._responses)
+
+
+class StubToolManager:
+    """Plain ToolManager stand-in that records calls and returns preset results in turn"""
+    
+    def __init__(self, *results: str, error: Exception = None):
+        self.calls = []
+        self.error = error
+        self._results = itertools.cycle(results or ("Tool result",))
+    
+    def execute_tool(self, tool_name: str, **kwargs) -> str:
+        self.calls.append((tool_name, kwargs))
+        if self.error is not None:
+            raise self.error
+        return next(self._results)
+    
+    async def aexecute_tool(self, tool_name: str, **kwargs) -> str:
+        return self.execute_tool(tool_name, **kwargs)
+
+
+class StubTool(Tool):
+    """Plain Tool with a fixed definition that records execute calls and returns a preset result"""
+    
+    def __init__(self, definition: Dict[str, Any], result: str = "Tool result"):
+        self.definition = definition
+        self.result = result
+        self.calls = []
+        self.last_sources = []
+    
+    def get_tool_definition(self) -> Dict[str, Any]:
+        return self.definition
+    
+    def execute(self, **kwargs) -> str:
+        self.calls.append(kwargs)
+        return self.result
+
+
+class FakeCollection:
+    """Plain ChromaDB collection stand-in that records calls and returns preset results
+    
+    query checks its arguments and the preset result against ChromaDB's call contract:
+    one query text or embedding per entry in a list, and one result list per query.
+    """
+    
+    def __init__(self, query_result: Dict[str, Any] = None, get_result: Dict[str, Any] = None,
+                 count_result: int = 0, error: Exception = None):
+        self.query_result = query_result
+        self.get_result = get_result
+        self.count_result = count_result
+        self.error = error
+        self.queries = []
+        self.gets = []
+        self.adds = []
+        self.upserts = []
+        self.count_calls = 0
+    
+    def query(self, **kwargs) -> Dict[str, Any]:
+        self.queries.append(kwargs)
+        if self.error is not None:
+            raise self.error
         
-        return MockResponse()
+        queries = kwargs.get("query_texts", kwargs.get("query_embeddings"))
+        if not isinstance(queries, list) or not queries:
+            raise TypeError(f"query_texts or query_embeddings must be a non-empty list, got {queries!r}")
+        if not isinstance(kwargs.get("n_results", 10), int):
+            raise TypeError(f"n_results must be an int, got {kwargs['n_results']!r}")
+        if not isinstance(kwargs.get("where") or {}, dict):
+            raise TypeError(f"where must be a dict or None, got {kwargs['where']!r}")
+        if self.query_result is not None:
+            for field in ("documents", "metadatas", "distances"):
+                if len(self.query_result[field]) != len(queries):
+                    raise ValueError(
+                        f"Preset {field} holds {len(self.query_result[field])} result lists "
+                        f"for {len(queries)} queries"
+                    )
+        return self.query_result
+    
+    def get(self, **kwargs) -> Dict[str, Any]:
+        self.gets.append(kwargs)
+        return self.get_result
+    
+    def add(self, **kwargs):
+        self.adds.append(kwargs)
+    
+    def upsert(self, **kwargs):
+        self.upserts.append(kwargs)
+    
+    def count(self) -> int:
+        self.count_calls += 1
+        return self.count_result
+
+
+class MockAnthropicStream:
+    """Mock for the async context manager returned by messages.stream"""
+    
+    def __init__(self, response):
+        self.response = response
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        return False
+    
+    @property
+    async def text_stream(self):
+        """Yield the response text in small deltas, skipping tool use blocks"""
+        for block in self.response.content:
+            if isinstance(block, MockContent):
+                for i in range(0, len(block.text), 16):
+                    yield block.text[i:i + 16]
+    
+    async def get_final_message(self):
+        return self.response
+
+
+class FailingAnthropicStream(MockAnthropicStream):
+    """MockAnthropicStream that raises after yielding its first text delta"""
+    
+    def __init__(self, response, error: Exception):
+        super().__init__(response)
+        self.error = error
+    
+    @property
+    async def text_stream(self):
+        async for text in super().text_stream:
+            yield text
+            raise self.error
+
+
+class MockAsyncAnthropicClient(MockAnthropicClient):
+    """MockAnthropicClient counterpart for AsyncAnthropic, sharing its response sequence"""
+    
+    def __init__(self):
+        super().__init__()
+        self.messages = SimpleNamespace(create=self.acreate_response, stream=self.stream_response)
+    
+    async def acreate_response(self, **kwargs):
+        """Mock async messages.create method"""
+        return self.create_response(**kwargs)
+    
+    def stream_response(self, **kwargs):
+        """Mock messages.stream method"""
+        return MockAnthropicStream(self.create_response(**kwargs))
 
 
 class MockContent:
     """Mock content block for Anthropic responses"""
+    __slots__ = ("text",)
+    type = "text"
+    
     def __init__(self, text: str):
         self.text = text
 
 
 class MockToolUse:
     """Mock tool use block for Anthropic responses"""
-    def __init__(self):
+    __slots__ = ("type", "id", "name", "input")
+    
+    def __init__(self, tool_id: str = "tool_123456"):
         self.type = "tool_use"
-        self.id = "tool_123456"
+        self.id = tool_id
         self.name = "search_course_content"
-        self.input = {"query": "python decorators", "course_name": "python"}
\ No newline at end of file
+        self.input = {"query": "python decorators", "course_name": "python"}
+
+
+# Canned responses are only read, never mutated, so tests share one instance each
+DIRECT_RESP = MockAnthropicResponse.direct_response()
+TOOL_USE_RESP = MockAnthropicResponse.tool_use_response()
+PREAMBLE_TOOL_RESP = MockAnthropicResponse.preamble_tool_use_response()
+FINAL_RESP = MockAnthropicResponse.final_response_after_tool()
+MULTI_TOOL_RESP = MockAnthropicResponse.multi_tool_use_response()
+MALFORMED_RESP = MockAnthropicResponse.malformed_tool_response()
+
+# Raw Messages API body for tests that mock the HTTP layer under a real SDK client
+ANTHROPIC_TEXT_MESSAGE = {
+    "id": "msg_test",
+    "type": "message",
+    "role": "assistant",
+    "model": "claude-sonnet-4-20250514",
+    "content": [{"type": "text", "text": "Python is a programming language."}],
+    "stop_reason": "end_turn",
+    "stop_sequence": None,
+    "usage": {"input_tokens": 10, "output_tokens": 8}
+}
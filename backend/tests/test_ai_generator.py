@@ -5,196 +5,186 @@ These tests validate the AI response generation, tool calling mechanism,
 and error handling of the AIGenerator component.
 """
 import pytest
-from unittest.mock import Mock, MagicMock, patch
+from contextlib import nullcontext as does_not_raise
+from unittest.mock import Mock
 import anthropic
 from ai_generator import AIGenerator
-from .fixtures import MockAnthropicResponse, MockToolUse
+from .fixtures import (
+    MockResponse, StubToolManager, FailingAnthropicStream,
+    DIRECT_RESP, TOOL_USE_RESP, PREAMBLE_TOOL_RESP, FINAL_RESP, MULTI_TOOL_RESP, MALFORMED_RESP
+)
 
+# Generators share clients per API key, so each test starts without cached ones
+pytestmark = pytest.mark.usefixtures("fresh_anthropic_clients")
 
-class MockAnthropicClient:
-    """Enhanced mock for Anthropic client with configurable responses"""
-    
-    def __init__(self):
-        self.messages = Mock()
-        self.call_count = 0
-        self.responses = []
-        self.call_args_list = []
-        
-    def set_responses(self, responses):
-        """Set a sequence of responses for subsequent calls"""
-        self.responses = responses
-        self.call_count = 0
-        self.call_args_list = []
-        
-    def create_response(self, **kwargs):
-        """Mock messages.create method"""
-        # Store call arguments for inspection
-        self.call_args_list.append(kwargs)
-        
-        if self.call_count < len(self.responses):
-            response = self.responses[self.call_count]
-        else:
-            response = MockAnthropicResponse.direct_response()
-            
-        self.call_count += 1
-        return response
+# Side effects only need to be raised, so tests share one exception instance each
+_API_ERR = anthropic.APIError("API Error", request=Mock(), body=None)
+_CONNECTION_ERR = anthropic.APIConnectionError(request=Mock())
+_TOOL_ERR = Exception("Tool execution failed")
+
+DIRECT_TEXT = "This is a direct response to your query about Python programming."
+FINAL_TEXT = "Based on the search results, Python decorators are a powerful feature for enhancing functions."
+SYSTEM_PROMPT_LOWER = AIGenerator.SYSTEM_PROMPT.lower()
+REQUIRED_PROMPT_PHRASES = frozenset({"course materials", "search tool", "up to 2 searches"})
+DECORATOR_SEARCH = ("search_course_content", {"query": "python decorators", "course_name": "python"})
+CACHED_SYSTEM_BLOCK = {
+    "type": "text",
+    "text": AIGenerator.SYSTEM_PROMPT,
+    "cache_control": {"type": "ephemeral"}
+}
+HISTORY = "User: What is Python?\nAssistant: Python is a programming language."
+SAMPLE_TOOLS = [{"name": "test_tool", "description": "Test tool"}]
+
+# (query, conversation history, tools, expected subset of the create() kwargs)
+DIRECT_CASES = [
+    pytest.param("What is Python?", None, None, {
+        "model": "claude-3-sonnet",
+        "temperature": 0,
+        "max_tokens": 800,
+        "messages": [{"role": "user", "content": "What is Python?"}],
+        "system": [CACHED_SYSTEM_BLOCK]
+    }, id="without_tools"),
+    pytest.param("Tell me more", HISTORY, None, {
+        "system": [CACHED_SYSTEM_BLOCK, {"type": "text", "text": f"Previous conversation:\n{HISTORY}"}]
+    }, id="with_history"),
+    pytest.param("Test query", None, SAMPLE_TOOLS, {
+        "tools": [{**SAMPLE_TOOLS[0], "cache_control": {"type": "ephemeral"}}],
+        "tool_choice": {"type": "auto"}
+    }, id="with_tools"),
+    pytest.param("", None, None, {
+        "messages": [{"role": "user", "content": ""}]
+    }, id="empty_query"),
+]
 
 
 class TestAIGeneratorInitialization:
     """Test AIGenerator initialization and configuration"""
     
-    def test_initialization(self):
+    def test_initialization(self, anthropic_cls):
         """Test proper initialization with API key and model"""
-        with patch('ai_generator.anthropic.Anthropic') as mock_anthropic:
-            generator = AIGenerator("test-api-key", "claude-3-sonnet")
-            
-            mock_anthropic.assert_called_once_with(api_key="test-api-key")
-            assert generator.model == "claude-3-sonnet"
-            assert generator.base_params["model"] == "claude-3-sonnet"
-            assert generator.base_params["temperature"] == 0
-            assert generator.base_params["max_tokens"] == 800
+        generator = AIGenerator("test-api-key", "claude-3-sonnet")
+        
+        anthropic_cls.assert_called_once_with(api_key="test-api-key")
+        assert generator.model == "claude-3-sonnet"
+        assert generator.base_params["model"] == "claude-3-sonnet"
+        assert generator.base_params["temperature"] == 0
+        assert generator.base_params["max_tokens"] == 800
+
+    def test_clients_shared_across_instances(self, anthropic_cls, async_anthropic_cls):
+        """Test that generators with the same API key reuse one client"""
+        first = AIGenerator("test-api-key", "claude-3-sonnet")
+        second = AIGenerator("test-api-key", "claude-3-sonnet")
+        
+        assert first.client is second.client
+        assert first.async_client is second.async_client
+        anthropic_cls.assert_called_once_with(api_key="test-api-key")
+        async_anthropic_cls.assert_called_once_with(api_key="test-api-key")
 
     def test_system_prompt_defined(self):
         """Test that system prompt is properly defined"""
         assert AIGenerator.SYSTEM_PROMPT is not None
-        assert "course materials" in AIGenerator.SYSTEM_PROMPT.lower()
-        assert "search tool" in AIGenerator.SYSTEM_PROMPT.lower()
-        assert "up to 2 searches" in AIGenerator.SYSTEM_PROMPT.lower()
+        for phrase in REQUIRED_PROMPT_PHRASES:
+            assert phrase in SYSTEM_PROMPT_LOWER
+
+
+# (API responses in order, expected tool executions, expected API calls, expected reply)
+TOOL_FLOW_CASES = [
+    pytest.param([TOOL_USE_RESP, FINAL_RESP], 1, 2, FINAL_TEXT, id="single_round"),
+    # Round 1: tool_use -> Round 2: tool_use -> final response forced without tools
+    pytest.param([TOOL_USE_RESP, TOOL_USE_RESP, FINAL_RESP], 2, 3, FINAL_TEXT, id="max_rounds_reached"),
+    # tool_use -> direct response, no second round needed
+    pytest.param([TOOL_USE_RESP, DIRECT_RESP], 1, 2, DIRECT_TEXT, id="early_termination"),
+]
 
 
 class TestDirectResponseGeneration:
     """Test direct response generation without tool use"""
     
-    @patch('ai_generator.anthropic.Anthropic')
-    def test_generate_response_without_tools(self, mock_anthropic_class):
-        """Test response generation without tool calling"""
-        # Setup mock client
-        mock_client = MockAnthropicClient()
-        mock_client.set_responses([MockAnthropicResponse.direct_response()])
-        mock_anthropic_class.return_value = mock_client
-        mock_client.messages.create = mock_client.create_response
-        
-        generator = AIGenerator("test-api-key", "claude-3-sonnet")
+    @pytest.mark.parametrize("query,history,tools,expect", DIRECT_CASES)
+    def test_direct_response(self, mock_client, generator, query, history, tools, expect):
+        """Test that a direct reply is returned and the request is shaped as expected"""
+        mock_client.set_responses([DIRECT_RESP])
         
-        response = generator.generate_response("What is Python?")
+        response = generator.generate_response(query, conversation_history=history, tools=tools)
         
-        assert response == "This is a direct response to your query about Python programming."
+        assert response == DIRECT_TEXT
         assert mock_client.call_count == 1
+        call_kwargs = mock_client.call_args_list[0]
+        for key, value in expect.items():
+            assert call_kwargs[key] == value
+        if tools is None:
+            assert "tools" not in call_kwargs
 
-    @patch('ai_generator.anthropic.Anthropic')
-    def test_generate_response_with_conversation_history(self, mock_anthropic_class):
-        """Test response generation with conversation history"""
-        mock_client = MockAnthropicClient() 
-        mock_client.set_responses([MockAnthropicResponse.direct_response()])
-        mock_anthropic_class.return_value = mock_client
-        mock_client.messages.create = mock_client.create_response
-        
-        generator = AIGenerator("test-api-key", "claude-3-sonnet")
-        
+    def test_system_content_reused_for_same_history(self, generator):
+        """Test that an equal history string reuses the same system blocks"""
         history = "User: What is Python?\nAssistant: Python is a programming language."
-        response = generator.generate_response("Tell me more", conversation_history=history)
-        
-        assert response == "This is a direct response to your query about Python programming."
+        first = generator._build_system_content(history)
+        second = generator._build_system_content(history[:10] + history[10:])
         
-        # Verify the create method was called with history in system prompt
-        call_kwargs = mock_client.call_args_list[0]
-        assert "Previous conversation:" in call_kwargs["system"]
-        assert history in call_kwargs["system"]
+        assert first is second
+        assert generator._build_system_content(None) is generator._build_system_content("")
+        assert generator._build_system_content("User: Hi") is not first
 
-    @patch('ai_generator.anthropic.Anthropic')  
-    def test_api_parameters_structure(self, mock_anthropic_class):
-        """Test that API parameters are structured correctly"""
-        mock_client = MockAnthropicClient()
-        mock_client.set_responses([MockAnthropicResponse.direct_response()])
-        mock_anthropic_class.return_value = mock_client
-        mock_client.messages.create = mock_client.create_response
-        
-        generator = AIGenerator("test-api-key", "claude-3-sonnet")
-        generator.generate_response("Test query")
-        
-        # Verify API call parameters
-        call_kwargs = mock_client.call_args_list[0]
-        
-        assert call_kwargs["model"] == "claude-3-sonnet"
-        assert call_kwargs["temperature"] == 0
-        assert call_kwargs["max_tokens"] == 800
-        assert len(call_kwargs["messages"]) == 1
-        assert call_kwargs["messages"][0]["role"] == "user"
-        assert call_kwargs["messages"][0]["content"] == "Test query"
-        assert AIGenerator.SYSTEM_PROMPT in call_kwargs["system"]
+    def test_token_efficient_tools_header(self, mock_client):
+        """Test that the token-efficient tools beta is only sent to models that need it"""
+        tools = [{"name": "search_course_content"}]
+        AIGenerator("test-api-key", "claude-3-7-sonnet-20250219").generate_response("Test query", tools=tools)
+        AIGenerator("test-api-key", "claude-sonnet-4-20250514").generate_response("Test query", tools=tools)
+        AIGenerator("test-api-key", "claude-3-7-sonnet-20250219").generate_response("Test query")
+        
+        assert mock_client.call_args_list[0]["extra_headers"] == {
+            "anthropic-beta": AIGenerator.TOKEN_EFFICIENT_TOOLS_BETA
+        }
+        assert "extra_headers" not in mock_client.call_args_list[1]
+        assert "extra_headers" not in mock_client.call_args_list[2]
 
 
 class TestToolCallingMechanism:
     """Test tool calling functionality"""
     
-    @patch('ai_generator.anthropic.Anthropic')
-    def test_generate_response_with_tools(self, mock_anthropic_class):
-        """Test response generation with tools available"""
-        mock_client = MockAnthropicClient()
-        mock_client.set_responses([MockAnthropicResponse.direct_response()])
-        mock_anthropic_class.return_value = mock_client  
-        mock_client.messages.create = mock_client.create_response
-        
-        generator = AIGenerator("test-api-key", "claude-3-sonnet")
-        
-        tools = [{"name": "test_tool", "description": "Test tool"}]
-        response = generator.generate_response("Test query", tools=tools)
+    @pytest.mark.parametrize("responses,expected_tool_calls,expected_api_calls,expected_response", TOOL_FLOW_CASES)
+    def test_sequential_tool_calling(self, mock_client, generator, mock_tool_manager,
+                                     responses, expected_tool_calls, expected_api_calls, expected_response):
+        """Test that tool rounds run until Claude stops asking for tools or the round limit is hit"""
+        mock_client.set_responses(responses)
         
-        assert response == "This is a direct response to your query about Python programming."
-        
-        # Verify tools were included in API call
-        call_kwargs = mock_client.call_args_list[0]
-        assert "tools" in call_kwargs
-        assert call_kwargs["tools"] == tools
-        assert call_kwargs["tool_choice"] == {"type": "auto"}
-
-    @patch('ai_generator.anthropic.Anthropic')
-    def test_single_round_tool_execution_flow(self, mock_anthropic_class):
-        """Test single round tool execution flow"""
-        mock_client = MockAnthropicClient()
-        
-        # Set up sequence: tool_use response, then final response
-        tool_use_response = MockAnthropicResponse.tool_use_response()
-        final_response = MockAnthropicResponse.final_response_after_tool()
-        mock_client.set_responses([tool_use_response, final_response])
-        
-        mock_anthropic_class.return_value = mock_client
-        mock_client.messages.create = mock_client.create_response
-        
-        generator = AIGenerator("test-api-key", "claude-3-sonnet")
-        
-        # Mock tool manager
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Search results: Python decorators are powerful..."
-        
-        tools = [{"name": "search_course_content"}]
         response = generator.generate_response(
             "What are Python decorators?",
-            tools=tools,
+            tools=[{"name": "search_course_content"}],
             tool_manager=mock_tool_manager
         )
         
-        assert response == "Based on the search results, Python decorators are a powerful feature for enhancing functions."
-        
-        # Verify tool was executed
-        mock_tool_manager.execute_tool.assert_called_once_with(
-            "search_course_content",
-            query="python decorators", 
-            course_name="python"
-        )
-        
-        # Verify two API calls were made (tool use + final response)
-        assert mock_client.call_count == 2
+        assert response == expected_response
+        assert mock_tool_manager.calls == [DECORATOR_SEARCH] * expected_tool_calls
+        assert mock_client.call_count == expected_api_calls
 
-    @patch('ai_generator.anthropic.Anthropic')
-    def test_tool_execution_without_tool_manager(self, mock_anthropic_class):
+    def test_prompt_cache_breakpoints(self, mock_client, generator, mock_tool_manager):
+        """Test that tools and each tool round are cached without exceeding 4 breakpoints"""
+        tools = [{"name": "search_course_content"}, {"name": "get_course_outline"}]
+        mock_client.set_responses([TOOL_USE_RESP, TOOL_USE_RESP, FINAL_RESP])
+        
+        generator.generate_response("What are Python decorators?", tools=tools, tool_manager=mock_tool_manager)
+        
+        first_call = mock_client.call_args_list[0]
+        assert "cache_control" not in first_call["tools"][0]
+        assert first_call["tools"][1]["cache_control"] == {"type": "ephemeral"}
+        # The caller's tool definitions are left untouched
+        assert tools == [{"name": "search_course_content"}, {"name": "get_course_outline"}]
+        
+        assert all(m["content"][-1]["cache_control"] == {"type": "ephemeral"}
+                   for m in mock_client.tool_result_messages)
+        
+        final_call = mock_client.last_kwargs
+        breakpoints = sum("cache_control" in block for block in final_call["system"])
+        breakpoints += sum("cache_control" in block for block in first_call["tools"])
+        breakpoints += sum("cache_control" in block
+                           for message in final_call["messages"] if isinstance(message["content"], list)
+                           for block in message["content"] if isinstance(block, dict))
+        assert breakpoints == 4
+
+    def test_tool_execution_without_tool_manager(self, mock_client, generator):
         """Test tool use response when no tool manager provided"""
-        mock_client = MockAnthropicClient()
-        mock_client.set_responses([MockAnthropicResponse.tool_use_response()])
-        mock_anthropic_class.return_value = mock_client
-        mock_client.messages.create = mock_client.create_response
-        
-        generator = AIGenerator("test-api-key", "claude-3-sonnet")
+        mock_client.set_responses([TOOL_USE_RESP])
         
         tools = [{"name": "search_course_content"}]
         
@@ -204,31 +194,9 @@ class TestToolCallingMechanism:
         # Since no tool manager, it should return empty string
         assert response == ""
 
-    @patch('ai_generator.anthropic.Anthropic')
-    def test_multiple_tool_calls(self, mock_anthropic_class):
+    def test_multiple_tool_calls(self, mock_client, generator, mock_tool_manager):
         """Test handling multiple tool calls in one response"""
-        mock_client = MockAnthropicClient()
-        
-        # Create a tool use response with multiple tool calls
-        class MultiToolUseResponse:
-            def __init__(self):
-                self.content = [
-                    MockToolUse(),
-                    MockToolUse()  
-                ]
-                self.stop_reason = "tool_use"
-        
-        multi_tool_response = MultiToolUseResponse()
-        final_response = MockAnthropicResponse.final_response_after_tool()
-        mock_client.set_responses([multi_tool_response, final_response])
-        
-        mock_anthropic_class.return_value = mock_client
-        mock_client.messages.create = mock_client.create_response
-        
-        generator = AIGenerator("test-api-key", "claude-3-sonnet")
-        
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Tool result"
+        mock_client.set_responses([MULTI_TOOL_RESP, FINAL_RESP])
         
         response = generator.generate_response(
             "Test query",
@@ -237,136 +205,16 @@ class TestToolCallingMechanism:
         )
         
         # Should execute both tools
-        assert mock_tool_manager.execute_tool.call_count == 2
-
-    @patch('ai_generator.anthropic.Anthropic')
-    def test_sequential_tool_calling_two_rounds(self, mock_anthropic_class):
-        """Test sequential tool calling with 2 rounds"""
-        mock_client = MockAnthropicClient()
-        
-        # Set up sequence: 
-        # Round 1: tool_use -> Round 2: tool_use -> Final response without tools
-        round1_tool_use = MockAnthropicResponse.tool_use_response()
-        round2_tool_use = MockAnthropicResponse.tool_use_response() 
-        final_response = MockAnthropicResponse.final_response_after_tool()
-        mock_client.set_responses([round1_tool_use, round2_tool_use, final_response])
-        
-        mock_anthropic_class.return_value = mock_client
-        mock_client.messages.create = mock_client.create_response
-        
-        generator = AIGenerator("test-api-key", "claude-3-sonnet")
-        
-        # Mock tool manager with different results for each call
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.side_effect = [
-            "Search results for course X: Lesson 4 is about data structures",
-            "Search results for courses about data structures: Found Course Y"
-        ]
-        
-        tools = [{"name": "search_course_content"}]
-        response = generator.generate_response(
-            "Search for a course that discusses the same topic as lesson 4 of course X",
-            tools=tools,
-            tool_manager=mock_tool_manager
-        )
-        
-        assert response == "Based on the search results, Python decorators are a powerful feature for enhancing functions."
-        
-        # Verify both tools were executed
-        assert mock_tool_manager.execute_tool.call_count == 2
-        
-        # Verify three API calls were made (2 tool rounds + 1 final)
-        assert mock_client.call_count == 3
-
-    @patch('ai_generator.anthropic.Anthropic')
-    def test_sequential_tool_calling_early_termination(self, mock_anthropic_class):
-        """Test early termination when no more tool use is needed"""
-        mock_client = MockAnthropicClient()
-        
-        # Set up sequence: tool_use -> direct response (no more tools)
-        tool_use_response = MockAnthropicResponse.tool_use_response()
-        direct_response = MockAnthropicResponse.direct_response()
-        mock_client.set_responses([tool_use_response, direct_response])
-        
-        mock_anthropic_class.return_value = mock_client
-        mock_client.messages.create = mock_client.create_response
-        
-        generator = AIGenerator("test-api-key", "claude-3-sonnet")
-        
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Complete search results"
-        
-        tools = [{"name": "search_course_content"}]
-        response = generator.generate_response(
-            "What are Python decorators?",
-            tools=tools,
-            tool_manager=mock_tool_manager
-        )
-        
-        assert response == "This is a direct response to your query about Python programming."
-        
-        # Verify only one tool execution
-        mock_tool_manager.execute_tool.assert_called_once()
-        
-        # Verify two API calls were made (1 tool round + 1 direct response)
-        assert mock_client.call_count == 2
-
-    @patch('ai_generator.anthropic.Anthropic')
-    def test_sequential_tool_calling_max_rounds_reached(self, mock_anthropic_class):
-        """Test behavior when maximum rounds are reached"""
-        mock_client = MockAnthropicClient()
-        
-        # Set up sequence: tool_use -> tool_use -> final response (forced without tools)
-        round1_tool_use = MockAnthropicResponse.tool_use_response()
-        round2_tool_use = MockAnthropicResponse.tool_use_response()
-        final_response = MockAnthropicResponse.final_response_after_tool()
-        mock_client.set_responses([round1_tool_use, round2_tool_use, final_response])
-        
-        mock_anthropic_class.return_value = mock_client
-        mock_client.messages.create = mock_client.create_response
-        
-        generator = AIGenerator("test-api-key", "claude-3-sonnet")
-        
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Search results"
-        
-        tools = [{"name": "search_course_content"}]
-        response = generator.generate_response(
-            "Complex query requiring multiple searches",
-            tools=tools,
-            tool_manager=mock_tool_manager
-        )
-        
-        assert response == "Based on the search results, Python decorators are a powerful feature for enhancing functions."
-        
-        # Verify both tools were executed (max rounds reached)
-        assert mock_tool_manager.execute_tool.call_count == 2
-        
-        # Verify three API calls were made (2 tool rounds + 1 final)
-        assert mock_client.call_count == 3
+        assert len(mock_tool_manager.calls) == 2
 
 
 class TestSequentialToolErrors:
     """Test error handling in sequential tool calling"""
     
-    @patch('ai_generator.anthropic.Anthropic')
-    def test_tool_execution_error_handling_in_sequence(self, mock_anthropic_class):
+    def test_tool_execution_error_handling_in_sequence(self, tool_flow_client, generator, mock_tool_manager):
         """Test handling of tool execution errors during sequential calls"""
-        mock_client = MockAnthropicClient()
-        
-        # Set up sequence: tool_use -> tool_use -> final response
-        tool_use_response = MockAnthropicResponse.tool_use_response()
-        final_response = MockAnthropicResponse.final_response_after_tool()
-        mock_client.set_responses([tool_use_response, final_response])
-        
-        mock_anthropic_class.return_value = mock_client
-        mock_client.messages.create = mock_client.create_response
-        
-        generator = AIGenerator("test-api-key", "claude-3-sonnet")
-        
         # Mock tool manager that fails on first call
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.side_effect = Exception("Tool execution failed")
+        mock_tool_manager.error = _TOOL_ERR
         
         tools = [{"name": "search_course_content"}]
         response = generator.generate_response(
@@ -379,26 +227,18 @@ class TestSequentialToolErrors:
         assert response == "Based on the search results, Python decorators are a powerful feature for enhancing functions."
         
         # Verify tool was attempted
-        mock_tool_manager.execute_tool.assert_called_once()
+        assert len(mock_tool_manager.calls) == 1
         
         # Verify API calls were made
-        assert mock_client.call_count == 2
+        assert tool_flow_client.call_count == 2
 
-    @patch('ai_generator.anthropic.Anthropic')
-    def test_api_error_handling_in_sequence(self, mock_anthropic_class):
+    def test_api_error_handling_in_sequence(self, mock_client, generator, mock_tool_manager):
         """Test handling of API errors during sequential calls"""
-        mock_client = Mock()
         # First call succeeds, second call fails
-        mock_client.messages.create.side_effect = [
-            MockAnthropicResponse.tool_use_response(),
-            Exception("API Error")
-        ]
-        mock_anthropic_class.return_value = mock_client
-        
-        generator = AIGenerator("test-api-key", "claude-3-sonnet")
-        
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Search results"
+        mock_client.messages.create = Mock(side_effect=[
+            TOOL_USE_RESP,
+            _CONNECTION_ERR
+        ])
         
         tools = [{"name": "search_course_content"}]
         response = generator.generate_response(
@@ -414,35 +254,31 @@ class TestSequentialToolErrors:
 class TestErrorHandling:
     """Test error handling and edge cases"""
     
-    @patch('ai_generator.anthropic.Anthropic')
-    def test_api_error_handling(self, mock_anthropic_class):
+    def test_api_error_handling(self, mock_client, generator):
         """Test handling of Anthropic API errors"""
-        mock_client = Mock()
-        mock_client.messages.create.side_effect = Exception("API Error")
-        mock_anthropic_class.return_value = mock_client
+        mock_client.messages.create = Mock(side_effect=_API_ERR)
         
-        generator = AIGenerator("test-api-key", "claude-3-sonnet")
-        
-        with pytest.raises(Exception):
+        with pytest.raises(anthropic.APIError):
             generator.generate_response("Test query")
 
-    @patch('ai_generator.anthropic.Anthropic')
-    def test_tool_execution_error_handling(self, mock_anthropic_class):
+    def test_non_api_error_after_first_round_propagates(self, mock_client, generator, mock_tool_manager):
+        """Test that only API errors are turned into the partial failure reply"""
+        mock_client.messages.create = Mock(side_effect=[
+            TOOL_USE_RESP,
+            RuntimeError("Unexpected bug")
+        ])
+        
+        with pytest.raises(RuntimeError):
+            generator.generate_response(
+                "Test query",
+                tools=[{"name": "search_course_content"}],
+                tool_manager=mock_tool_manager
+            )
+
+    def test_tool_execution_error_handling(self, tool_flow_client, generator, mock_tool_manager):
         """Test handling of tool execution errors"""
-        mock_client = MockAnthropicClient()
-        
-        tool_use_response = MockAnthropicResponse.tool_use_response()
-        final_response = MockAnthropicResponse.final_response_after_tool()
-        mock_client.set_responses([tool_use_response, final_response])
-        
-        mock_anthropic_class.return_value = mock_client
-        mock_client.messages.create = mock_client.create_response
-        
-        generator = AIGenerator("test-api-key", "claude-3-sonnet")
-        
         # Mock tool manager that raises an exception
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.side_effect = Exception("Tool execution failed")
+        mock_tool_manager.error = _TOOL_ERR
         
         # This should handle the tool error gracefully and continue
         response = generator.generate_response(
@@ -454,97 +290,275 @@ class TestErrorHandling:
         # Should return final response despite tool error
         assert response == "Based on the search results, Python decorators are a powerful feature for enhancing functions."
 
-    @patch('ai_generator.anthropic.Anthropic') 
-    def test_empty_query_handling(self, mock_anthropic_class):
-        """Test handling of empty queries"""
-        mock_client = MockAnthropicClient()
-        mock_client.set_responses([MockAnthropicResponse.direct_response()])
-        mock_anthropic_class.return_value = mock_client
-        mock_client.messages.create = mock_client.create_response
+    @pytest.mark.parametrize("malformed_response,expectation", [
+        # A tool_use block without usable attributes is reported back as a tool error
+        pytest.param(MALFORMED_RESP, does_not_raise(), id="tool_block_without_attributes"),
+        # A final answer without a text block has nothing to return
+        pytest.param(
+            MockResponse(content=[object()], stop_reason="end_turn"),
+            pytest.raises(AttributeError),
+            id="text_block_without_text"
+        ),
+    ])
+    def test_malformed_tool_response(self, mock_client, generator, mock_tool_manager, malformed_response, expectation):
+        """Test handling of malformed tool responses"""
+        mock_client.set_responses([malformed_response, FINAL_RESP])
         
-        generator = AIGenerator("test-api-key", "claude-3-sonnet")
+        with expectation:
+            response = generator.generate_response(
+                "Test query",
+                tools=[{"name": "search_course_content"}],
+                tool_manager=mock_tool_manager
+            )
+            assert response == "Based on the search results, Python decorators are a powerful feature for enhancing functions."
+            assert mock_tool_manager.calls == []
+
+
+class TestMessageFlow:
+    """Test message flow in tool calling"""
+    
+    def test_message_history_in_tool_flow(self, tool_flow_client, generator, mock_tool_manager):
+        """Test that message history is properly maintained during tool calling"""
+        response = generator.generate_response(
+            "Test query",
+            tools=[{"name": "search_course_content"}],
+            tool_manager=mock_tool_manager
+        )
         
-        response = generator.generate_response("")
+        # Check that final API call includes the tool result
+        assert tool_flow_client.call_count == 2
         
-        assert response == "This is a direct response to your query about Python programming."
+        # The second call should have more messages (original + assistant + tool results)
+        assert len(tool_flow_client.last_kwargs["messages"]) == 3
+        
+        # Should have sent exactly one tool result message back
+        assert tool_flow_client.tool_result_messages == [{
+            "role": "user",
+            "content": [{
+                "type": "tool_result",
+                "tool_use_id": "tool_123456",
+                "content": "Tool result",
+                "cache_control": {"type": "ephemeral"}
+            }]
+        }]
+
+class TestCompletionCache:
+    """Test the exact-match cache for deterministic completions"""
+    
+    def test_identical_request_served_from_cache(self, mock_client, generator):
+        """Test that repeating an identical request doesn't call the API again"""
+        mock_client.set_responses([DIRECT_RESP])
         
-        # Verify empty string was passed to API
-        call_kwargs = mock_client.call_args_list[0]
-        assert call_kwargs["messages"][0]["content"] == ""
+        first = generator.generate_response("What is Python?")
+        second = generator.generate_response("What is Python?")
+        
+        assert first == second
+        assert mock_client.call_count == 1
 
-    @patch('ai_generator.anthropic.Anthropic')
-    def test_malformed_tool_response(self, mock_anthropic_class):
-        """Test handling of malformed tool responses"""
-        mock_client = MockAnthropicClient()
+    def test_different_history_misses_cache(self, mock_client, generator):
+        """Test that conversation history is part of the cache key"""
+        generator.generate_response("Tell me more")
+        generator.generate_response("Tell me more", conversation_history="User: Hi\nAssistant: Hello")
         
-        # Create malformed tool use response
-        class MalformedToolResponse:
-            def __init__(self):
-                self.content = [Mock()]  # Mock without proper attributes
-                self.stop_reason = "tool_use"
+        assert mock_client.call_count == 2
+
+    def test_tool_use_response_not_cached(self, mock_client, generator, mock_tool_manager):
+        """Test that intermediate tool_use responses are always re-requested"""
+        mock_client.set_responses([
+            TOOL_USE_RESP,
+            FINAL_RESP,
+            TOOL_USE_RESP,
+            FINAL_RESP
+        ])
+        
+        for _ in range(2):
+            generator.generate_response(
+                "What are Python decorators?",
+                tools=[{"name": "search_course_content"}],
+                tool_manager=mock_tool_manager
+            )
         
-        malformed_response = MalformedToolResponse()
-        final_response = MockAnthropicResponse.final_response_after_tool()
-        mock_client.set_responses([malformed_response, final_response])
+        assert len(mock_tool_manager.calls) == 2
+        assert mock_client.call_count == 4
+
+    def test_cache_evicts_least_recently_used(self, mock_client, generator):
+        """Test that the cache stays bounded and keeps recently used entries"""
+        generator.COMPLETION_CACHE_SIZE = 2
+        
+        generator.generate_response("first")
+        generator.generate_response("second")
+        generator.generate_response("first")
+        generator.generate_response("third")
+        assert mock_client.call_count == 3
         
-        mock_anthropic_class.return_value = mock_client
-        mock_client.messages.create = mock_client.create_response
+        # "first" was refreshed before "third" arrived, so "second" was evicted
+        generator.generate_response("first")
+        assert mock_client.call_count == 3
+        generator.generate_response("second")
+        assert mock_client.call_count == 4
+
+
+class TestBatchGeneration:
+    """Test offline generation through the Message Batches API"""
+    
+    def test_generate_batch(self, anthropic_cls):
+        """Test that batch results are polled for and returned in query order"""
+        mock_client = Mock()
+        anthropic_cls.return_value = mock_client
+        
+        mock_client.messages.batches.create.return_value = Mock(id="batch_1", processing_status="in_progress")
+        mock_client.messages.batches.retrieve.return_value = Mock(id="batch_1", processing_status="ended")
+        
+        def result(custom_id, result_type, text=None):
+            entry = Mock(custom_id=custom_id)
+            entry.result.type = result_type
+            entry.result.message.content = [Mock(text=text)]
+            return entry
+        
+        # Results can arrive in any order
+        mock_client.messages.batches.results.return_value = [
+            result("1", "succeeded", "Second answer"),
+            result("2", "errored"),
+            result("0", "succeeded", "First answer")
+        ]
         
         generator = AIGenerator("test-api-key", "claude-3-sonnet")
         
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Result"
+        responses = generator.generate_batch(
+            ["First?", "Second?", "Third?"],
+            conversation_histories=[None, "User: Hi\nAssistant: Hello", None],
+            poll_interval=0
+        )
         
-        # This should handle malformed response gracefully
-        try:
-            response = generator.generate_response(
-                "Test query",
-                tools=[{"name": "search_course_content"}],
-                tool_manager=mock_tool_manager
-            )
-            # If it doesn't crash, that's good
-            assert isinstance(response, str) or response is None
-        except AttributeError:
-            # Expected if mock doesn't have proper attributes
-            pass
+        assert responses == ["First answer", "Second answer", AIGenerator.FINAL_FAILURE_RESPONSE]
+        mock_client.messages.batches.retrieve.assert_called_once_with("batch_1")
+        
+        requests = mock_client.messages.batches.create.call_args[1]["requests"]
+        assert [r["custom_id"] for r in requests] == ["0", "1", "2"]
+        assert requests[1]["params"]["messages"] == [{"role": "user", "content": "Second?"}]
+        assert len(requests[1]["params"]["system"]) == 2
+        assert "tools" not in requests[0]["params"]
 
+    def test_generate_batch_rejects_misaligned_histories(self, anthropic_cls):
+        """Test that a history list of the wrong length fails instead of dropping queries"""
+        mock_client = Mock()
+        anthropic_cls.return_value = mock_client
+        
+        generator = AIGenerator("test-api-key", "claude-3-sonnet")
+        
+        with pytest.raises(ValueError, match="1 conversation histories for 2 queries"):
+            generator.generate_batch(["First?", "Second?"], conversation_histories=[None])
+        mock_client.messages.batches.create.assert_not_called()
 
-class TestMessageFlow:
-    """Test message flow in tool calling"""
+
+class TestAsyncGeneration:
+    """Test the async generation path"""
     
-    @patch('ai_generator.anthropic.Anthropic')
-    def test_message_history_in_tool_flow(self, mock_anthropic_class):
-        """Test that message history is properly maintained during tool calling"""
-        mock_client = MockAnthropicClient()
+    @pytest.mark.asyncio
+    async def test_agenerate_response_direct(self, mock_client, mock_async_client, async_generator):
+        """Test async response generation without tool calling"""
+        response = await async_generator.agenerate_response("What is Python?")
         
-        tool_use_response = MockAnthropicResponse.tool_use_response()
-        final_response = MockAnthropicResponse.final_response_after_tool()
-        mock_client.set_responses([tool_use_response, final_response])
+        assert response == "This is a direct response to your query about Python programming."
+        assert mock_async_client.call_count == 1
+        # The sync client must not be used on the async path
+        assert mock_client.call_count == 0
+
+    @pytest.mark.asyncio
+    async def test_agenerate_response_tool_flow(self, mock_async_client, async_generator, mock_tool_manager):
+        """Test async tool execution flow"""
+        mock_async_client.set_responses([TOOL_USE_RESP, FINAL_RESP])
         
-        mock_anthropic_class.return_value = mock_client
-        mock_client.messages.create = mock_client.create_response
+        response = await async_generator.agenerate_response(
+            "What are Python decorators?",
+            tools=[{"name": "search_course_content"}],
+            tool_manager=mock_tool_manager
+        )
         
-        generator = AIGenerator("test-api-key", "claude-3-sonnet")
+        assert response == "Based on the search results, Python decorators are a powerful feature for enhancing functions."
+        assert mock_tool_manager.calls == [("search_course_content", {"query": "python decorators", "course_name": "python"})]
+        assert mock_async_client.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_agenerate_response_parallel_tool_calls(self, mock_async_client, async_generator):
+        """Test that multiple tool calls in one round are gathered with matching ids"""
+        mock_async_client.set_responses([MULTI_TOOL_RESP, FINAL_RESP])
         
-        mock_tool_manager = Mock()
-        mock_tool_manager.execute_tool.return_value = "Tool execution result"
+        mock_tool_manager = StubToolManager("First result", "Second result")
         
-        response = generator.generate_response(
+        await async_generator.agenerate_response(
             "Test query",
             tools=[{"name": "search_course_content"}],
             tool_manager=mock_tool_manager
         )
         
-        # Check that final API call includes the tool result
-        assert mock_client.call_count == 2
+        assert len(mock_tool_manager.calls) == 2
         
-        # The second call should have more messages (original + assistant + tool results)
-        second_call_kwargs = mock_client.call_args_list[1]
-        messages = second_call_kwargs["messages"]
+        # Tool results must be paired with the tool_use id that requested them
+        messages = mock_async_client.call_args_list[1]["messages"]
+        tool_results = messages[-1]["content"]
+        assert [(r["tool_use_id"], r["content"]) for r in tool_results] == [
+            ("tool_123456", "First result"),
+            ("tool_654321", "Second result")
+        ]
+
+    @pytest.mark.asyncio
+    async def test_agenerate_response_stream_tool_flow(self, mock_async_client, async_generator, mock_tool_manager):
+        """Test that streaming runs tool rounds and yields the answer from a round that offered tools"""
+        mock_async_client.set_responses([TOOL_USE_RESP, FINAL_RESP])
+        
+        chunks = [chunk async for chunk in async_generator.agenerate_response_stream(
+            "What are Python decorators?",
+            tools=[{"name": "search_course_content"}],
+            tool_manager=mock_tool_manager
+        )]
+        
+        assert chunks == [FINAL_TEXT]
+        assert len(mock_tool_manager.calls) == 1
+        assert mock_async_client.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_agenerate_response_stream_drops_tool_round_text(self, mock_async_client, async_generator, mock_tool_manager):
+        """Test that text written alongside a tool call is not yielded, and the final answer is streamed"""
+        mock_async_client.set_responses([PREAMBLE_TOOL_RESP, PREAMBLE_TOOL_RESP, FINAL_RESP])
+        
+        chunks = [chunk async for chunk in async_generator.agenerate_response_stream(
+            "What are Python decorators?",
+            tools=[{"name": "search_course_content"}],
+            tool_manager=mock_tool_manager
+        )]
+        
+        assert len(chunks) > 1
+        assert "".join(chunks) == FINAL_TEXT
+        assert len(mock_tool_manager.calls) == 2
+        # The answer round after the last tool round is made without tools
+        assert "tools" not in mock_async_client.last_kwargs
+
+    @pytest.mark.asyncio
+    async def test_agenerate_response_stream_error_after_first_chunk(self, mock_async_client, async_generator, mock_tool_manager):
+        """Test that a stream failing mid-answer raises instead of appending a fallback to the partial answer"""
+        mock_async_client.set_responses([TOOL_USE_RESP, TOOL_USE_RESP])
+        mock_async_client.messages.stream = lambda **kwargs: FailingAnthropicStream(FINAL_RESP, _API_ERR)
+        
+        chunks = []
+        with pytest.raises(anthropic.APIError):
+            async for chunk in async_generator.agenerate_response_stream(
+                "What are Python decorators?",
+                tools=[{"name": "search_course_content"}],
+                tool_manager=mock_tool_manager
+            ):
+                chunks.append(chunk)
+        
+        assert chunks == [FINAL_TEXT[:16]]
+
+    @pytest.mark.asyncio
+    async def test_agenerate_response_stream_releases_request_slot(self, mock_client, mock_async_client):
+        """Test that a caller still reading the stream doesn't hold a concurrent request slot"""
+        generator = AIGenerator("test-api-key", "claude-3-sonnet", max_concurrent_requests=1)
         
-        assert len(messages) >= 2  # At least user message + tool results
+        stream = generator.agenerate_response_stream("What is Python?")
+        first_chunk = await stream.__anext__()
         
-        # Should have tool result message
-        tool_result_message = next((msg for msg in messages if msg["role"] == "user" and 
-                                   isinstance(msg["content"], list)), None)
-        assert tool_result_message is not None
\ No newline at end of file
+        assert DIRECT_TEXT.startswith(first_chunk)
+        assert not generator._request_semaphore.locked()
+        await stream.aclose()
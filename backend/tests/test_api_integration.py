@@ -2,27 +2,73 @@
 Test the actual FastAPI endpoints to identify potential API-level issues.
 """
 import pytest
+import logging
 import json
+from collections import OrderedDict
 from fastapi.testclient import TestClient
-from unittest.mock import patch, Mock
-import sys
-import os
+from unittest.mock import Mock, patch
 
-# Add the backend directory to Python path
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + '/..')
+from .fixtures import ANTHROPIC_TEXT_MESSAGE
 
-from app import app
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    """Import the app without building its RAG system, so request handling tests stay cheap"""
+    with patch("rag_system.RAGSystem"):
+        import app
+    return app
+
+
+@pytest.fixture(scope="session")
+def live_rag_system():
+    """Real RAG system built once per session; loads the embedding model and the persisted vector store"""
+    from config import config
+    from rag_system import RAGSystem
+    return RAGSystem(config)
 
 
 @pytest.fixture
-def client():
-    """Create a test client for the FastAPI app"""
-    return TestClient(app)
+def live_app(app_module, live_rag_system, monkeypatch):
+    """Serve the test's requests with the real RAG system"""
+    monkeypatch.setattr(app_module, "rag_system", live_rag_system)
+    return app_module
+
+
+@pytest.fixture(scope="session")
+def client(app_module):
+    """Create one test client for the FastAPI app, shared by every test"""
+    return TestClient(app_module.app)
+
 
+@pytest.fixture
+def anthropic_api(live_app, monkeypatch, anthropic_http_client):
+    """Answer the app's Anthropic requests in-process; call the fixture to change the response"""
+    ai_generator = live_app.rag_system.ai_generator
+    
+    def respond(status_code=200, body=ANTHROPIC_TEXT_MESSAGE):
+        monkeypatch.setattr(ai_generator, "async_client", anthropic_http_client(status_code, body))
+    
+    # Start every test without answers cached by earlier ones
+    monkeypatch.setattr(ai_generator, "_completion_cache", OrderedDict())
+    live_app.rag_system.response_cache.clear()
+    respond()
+    return respond
+
+
+@pytest.fixture
+def mock_rag(app_module, monkeypatch):
+    """Replace the app's RAG system for tests that only exercise request handling"""
+    rag = Mock()
+    monkeypatch.setattr(app_module, "rag_system", rag)
+    return rag
 
-def test_query_endpoint_success(client):
+
+@pytest.mark.slow
+def test_query_endpoint_success(client, anthropic_api):
     """Test successful query to the API endpoint"""
-    print("\n=== TESTING QUERY ENDPOINT ===")
+    logger.debug("\n=== TESTING QUERY ENDPOINT ===")
     
     # Test data
     query_data = {
@@ -30,147 +76,137 @@ def test_query_endpoint_success(client):
         "session_id": None
     }
     
-    try:
-        response = client.post("/api/query", json=query_data)
-        
-        print(f"Status Code: {response.status_code}")
-        print(f"Response Headers: {dict(response.headers)}")
-        
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✓ Query successful")
-            print(f"Answer length: {len(data.get('answer', ''))}")
-            print(f"Sources count: {len(data.get('sources', []))}")
-            print(f"Session ID: {data.get('session_id', 'None')}")
-            print(f"Answer preview: {data.get('answer', '')[:100]}...")
-            
-        else:
-            print(f"✗ Query failed with status {response.status_code}")
-            print(f"Response body: {response.text}")
-            
-            # This might be where we find the "query failed" error
-            if "query failed" in response.text.lower():
-                print("🎯 FOUND IT: This is where 'query failed' comes from!")
-                
-    except Exception as e:
-        print(f"✗ Exception during API call: {e}")
-        import traceback
-        traceback.print_exc()
-
-
-def test_query_endpoint_with_invalid_data(client):
-    """Test query endpoint with invalid data to reproduce errors"""
-    print("\n=== TESTING QUERY ENDPOINT WITH INVALID DATA ===")
-    
-    # Test cases that might cause "query failed"
-    test_cases = [
-        {"description": "Empty query", "data": {"query": ""}},
-        {"description": "No query field", "data": {}},
-        {"description": "Invalid session_id", "data": {"query": "test", "session_id": "invalid"}},
-        {"description": "Null query", "data": {"query": None}},
-    ]
+    response = client.post("/api/query", json=query_data)
+    
+    logger.debug(f"Status Code: {response.status_code}")
+    logger.debug(f"Response body: {response.text}")
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert data["answer"] == ANTHROPIC_TEXT_MESSAGE["content"][0]["text"]
+    assert isinstance(data["sources"], list)
+    assert data["session_id"]
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("data", [
+    pytest.param({"query": ""}, id="empty_query"),
+    pytest.param({"query": "test", "session_id": "invalid"}, id="invalid_session_id"),
+])
+def test_query_endpoint_with_unusual_data(client, anthropic_api, data):
+    """Test that unusual but valid query data is still answered"""
+    response = client.post("/api/query", json=data)
+    
+    assert response.status_code == 200, response.text
+
+
+@pytest.mark.parametrize("data", [
+    pytest.param({}, id="no_query_field"),
+    pytest.param({"query": None}, id="null_query"),
+])
+def test_query_endpoint_with_invalid_data(client, mock_rag, data):
+    """Test that invalid query data is rejected by validation before reaching the RAG system"""
+    response = client.post("/api/query", json=data)
+    
+    assert response.status_code == 422, response.text
+    mock_rag.aquery.assert_not_called()
+
+
+@pytest.mark.slow
+def test_query_endpoint_with_api_error(client, anthropic_api):
+    """Test query endpoint when the Anthropic API fails"""
+    logger.debug("\n=== TESTING WITH A FAILING ANTHROPIC API ===")
+    
+    anthropic_api(500, {"type": "error", "error": {"type": "api_error", "message": "Internal error"}})
+    
+    response = client.post("/api/query", json={"query": "test"})
     
-    for test_case in test_cases:
-        print(f"\n--- Testing: {test_case['description']} ---")
-        
-        try:
-            response = client.post("/api/query", json=test_case['data'])
-            print(f"Status Code: {response.status_code}")
-            
-            if response.status_code != 200:
-                print(f"Response: {response.text}")
-                if "query failed" in response.text.lower():
-                    print("🎯 FOUND 'query failed' error source!")
-                    
-        except Exception as e:
-            print(f"Exception: {e}")
-
-
-def test_query_endpoint_with_api_error():
-    """Test query endpoint when internal components fail"""
-    print("\n=== TESTING WITH MOCKED COMPONENT FAILURES ===")
-    
-    # Test with mocked RAG system that fails
-    with patch('app.rag_system') as mock_rag:
-        mock_rag.query.side_effect = Exception("Internal error")
-        
-        client = TestClient(app)
-        response = client.post("/api/query", json={"query": "test"})
-        
-        print(f"Status Code with internal error: {response.status_code}")
-        print(f"Response: {response.text}")
-        
-        if "query failed" in response.text.lower():
-            print("🎯 FOUND IT: Internal errors cause 'query failed'")
-
-
-def test_courses_endpoint(client):
+    logger.debug(f"Status Code with internal error: {response.status_code}")
+    logger.debug(f"Response: {response.text}")
+    
+    assert response.status_code == 500
+    assert "Internal error" in response.json()["detail"]
+
+
+def test_stream_query_endpoint(client, mock_rag):
+    """Test that the streaming endpoint emits text deltas then a done event"""
+    logger.debug("\n=== TESTING STREAMING QUERY ENDPOINT ===")
+    
+    async def stream_events(query, session_id):
+        yield {"type": "text", "text": "Python is "}
+        yield {"type": "text", "text": "a language."}
+        yield {"type": "sources", "sources": [{"display": "Python Basics - Lesson 1", "link": None}]}
+    
+    mock_rag.session_manager.create_session.return_value = "session_1"
+    mock_rag.astream_query.side_effect = stream_events
+    
+    response = client.post("/api/query/stream", json={"query": "What is Python?"})
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    
+    events = [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+    assert "".join(event["text"] for event in events if event["type"] == "text") == "Python is a language."
+    assert events[-1] == {
+        "type": "done",
+        "sources": [{"display": "Python Basics - Lesson 1", "link": None}],
+        "session_id": "session_1"
+    }
+
+
+def test_stream_query_endpoint_reports_errors(client, mock_rag):
+    """Test that a failure after part of the answer was streamed ends the stream with an error event"""
+    async def stream_events(query, session_id):
+        yield {"type": "text", "text": "Python is "}
+        raise RuntimeError("API Error")
+    
+    mock_rag.session_manager.create_session.return_value = "session_1"
+    mock_rag.astream_query.side_effect = stream_events
+    
+    response = client.post("/api/query/stream", json={"query": "What is Python?"})
+    
+    events = [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+    assert events == [
+        {"type": "text", "text": "Python is "},
+        {"type": "error", "detail": "API Error"}
+    ]
+
+
+@pytest.mark.slow
+def test_courses_endpoint(client, live_app):
     """Test the courses endpoint"""
-    print("\n=== TESTING COURSES ENDPOINT ===")
-    
-    try:
-        response = client.get("/api/courses")
-        
-        print(f"Status Code: {response.status_code}")
-        
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✓ Courses endpoint successful")
-            print(f"Total courses: {data.get('total_courses', 0)}")
-            print(f"Course titles: {data.get('course_titles', [])}")
-            
-        else:
-            print(f"✗ Courses endpoint failed: {response.text}")
-            
-    except Exception as e:
-        print(f"✗ Exception: {e}")
-
-
-def test_session_endpoint_if_exists(client):
+    response = client.get("/api/courses")
+    
+    logger.debug(f"Courses response: {response.text}")
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total_courses"] == len(data["course_titles"])
+
+
+@pytest.mark.slow
+def test_session_endpoint_if_exists(client, live_app):
     """Test session clearing endpoint if it exists"""
-    print("\n=== TESTING SESSION ENDPOINT ===")
-    
-    try:
-        # Try to clear a session
-        response = client.delete("/api/session/test_session_123")
-        
-        print(f"Status Code: {response.status_code}")
-        print(f"Response: {response.text}")
-        
-        if response.status_code == 200:
-            print("✓ Session endpoint working")
-        else:
-            print("ℹ️  Session endpoint might not be implemented or failing")
-            
-    except Exception as e:
-        print(f"Exception: {e}")
+    response = client.delete("/api/session/test_session_123")
+    
+    logger.debug(f"Session response: {response.status_code} {response.text}")
+    
+    if response.status_code == 404:
+        pytest.skip("Session endpoint not implemented")
+    assert response.status_code == 200
+    assert response.json()["status"] == "success"
 
 
 def test_root_endpoint(client):
     """Test if the root endpoint serves the frontend"""
-    print("\n=== TESTING ROOT ENDPOINT ===")
-    
-    try:
-        response = client.get("/")
-        
-        print(f"Status Code: {response.status_code}")
-        print(f"Content Type: {response.headers.get('content-type', 'Unknown')}")
-        
-        if response.status_code == 200:
-            print("✓ Root endpoint working (serves frontend)")
-        else:
-            print(f"✗ Root endpoint failed: {response.text}")
-            
-    except Exception as e:
-        print(f"Exception: {e}")
+    response = client.get("/")
+    
+    logger.debug(f"Root response: {response.status_code} {response.headers.get('content-type')}")
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/html")
 
 
 if __name__ == "__main__":
-    client = TestClient(app)
-    
-    test_query_endpoint_success(client)
-    test_query_endpoint_with_invalid_data(client)
-    test_query_endpoint_with_api_error()
-    test_courses_endpoint(client)
-    test_session_endpoint_if_exists(client)
-    test_root_endpoint(client)
\ No newline at end of file
+    # Run through pytest so the fixtures are available; -m "" includes the slow tests
+    pytest.main([__file__, "-m", "", "--log-cli-level=DEBUG"])
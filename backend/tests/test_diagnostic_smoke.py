@@ -0,0 +1,95 @@
+"""
+Diagnostic smoke tests for the RAG system.
+
+These check the query path wiring with the vector store and Anthropic client mocked,
+so they run in milliseconds without network access or an API key. The live version
+of the diagnostic is in test_diagnostic_live.py.
+"""
+import pytest
+import logging
+import importlib.util
+import os
+from unittest.mock import Mock, patch, DEFAULT
+from rag_system import RAGSystem, SUPPORTED_DOCUMENT_EXTENSIONS
+from .fixtures import MockTestData
+
+logger = logging.getLogger(__name__)
+
+
+def test_rag_system_query_smoke(config, tool_flow_client):
+    """Check that a query flows through Claude, the search tool and back with sources"""
+    mock_vector_store = Mock()
+    mock_vector_store.search.return_value = MockTestData.get_sample_search_results()
+    mock_vector_store.get_lesson_link.return_value = "https://example.com/lesson3"
+    mock_vector_store.embedding_function.side_effect = lambda texts: [[1.0, 0.0] for _ in texts]
+    
+    with patch.multiple('rag_system',
+                        VectorStore=Mock(return_value=mock_vector_store),
+                        DocumentProcessor=DEFAULT):
+        rag_system = RAGSystem(config)
+    
+    response, sources = rag_system.query("What are Python decorators?")
+    
+    assert "Python decorators are a powerful feature" in response
+    assert tool_flow_client.call_count == 2
+    mock_vector_store.search.assert_called_once_with(
+        query="python decorators", course_name="python", lesson_number=None
+    )
+    # One source per search result chunk
+    assert sources == [
+        {"display": "Advanced Python Programming - Lesson 3", "link": "https://example.com/lesson3"}
+    ] * 2
+
+
+def test_check_dependencies():
+    """Check if all required dependencies are available"""
+    logger.debug("\n=== DEPENDENCY CHECK ===")
+    
+    # find_spec locates each package without paying for its import
+    for module_name, label in [
+        ("chromadb", "ChromaDB"),
+        ("anthropic", "Anthropic"),
+        ("sentence_transformers", "SentenceTransformers"),
+    ]:
+        if importlib.util.find_spec(module_name) is not None:
+            logger.debug(f"✓ {label} available")
+        else:
+            logger.debug(f"✗ {label} missing")
+
+
+@pytest.mark.slow
+def test_embedding_model_loads(shared_embedding_function):
+    """Check that the embedding model loads, reusing the session-wide instance"""
+    logger.debug("\n=== EMBEDDING MODEL CHECK ===")
+    
+    if shared_embedding_function is not None:
+        logger.debug("✓ Embedding model loaded successfully")
+    else:
+        logger.debug("✗ Embedding model failed to load")
+
+
+def test_check_data_directory():
+    """Check if docs directory exists and has files"""
+    logger.debug("\n=== DATA DIRECTORY CHECK ===")
+    
+    docs_path = "../docs"
+    if os.path.exists(docs_path):
+        logger.debug(f"✓ Docs directory exists: {docs_path}")
+        with os.scandir(docs_path) as entries:
+            files = [entry.name for entry in entries
+                     if entry.is_file() and os.path.splitext(entry.name)[1].lower() in SUPPORTED_DOCUMENT_EXTENSIONS]
+        logger.debug(f"Document files found: {len(files)}")
+        for file in files:
+            logger.debug(f"  - {file}")
+            
+        if len(files) == 0:
+            logger.debug("⚠️  WARNING: No document files found in docs directory")
+            logger.debug("This could explain why there's no course data")
+            
+    else:
+        logger.debug(f"✗ Docs directory not found: {docs_path}")
+        logger.debug("This explains why there's no course data to search")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "--log-cli-level=DEBUG"])
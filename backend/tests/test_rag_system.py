@@ -6,38 +6,53 @@ the interaction between components and overall query processing workflow.
 """
 import pytest
 import os
-import tempfile
-from unittest.mock import Mock, patch, MagicMock
+import threading
+from dataclasses import replace
+from unittest.mock import Mock, AsyncMock, patch, DEFAULT
 from rag_system import RAGSystem
-from config import Config
-from .fixtures import MockTestData, MockAnthropicResponse
+from ai_generator import AIGenerator
+from .fixtures import MockTestData
+
+
+@pytest.fixture(scope="module")
+def rag_components():
+    """Patch RAGSystem's heavy components once for the whole module"""
+    # Plain Mock classes: resetting a MagicMock's side effects would also wipe its default __eq__
+    with patch.multiple('rag_system', new_callable=Mock,
+                        VectorStore=DEFAULT, AIGenerator=DEFAULT, DocumentProcessor=DEFAULT) as mocks:
+        yield mocks
+
+
+@pytest.fixture
+def rag_env(config, rag_components):
+    """Shared test config plus the patched component classes, reset for this test"""
+    for mock_class in rag_components.values():
+        mock_class.reset_mock(return_value=True, side_effect=True)
+
+    return config, rag_components
 
 
 class TestRAGSystemInitialization:
     """Test RAG system initialization and component setup"""
     
-    @patch('rag_system.VectorStore')
-    @patch('rag_system.AIGenerator') 
-    @patch('rag_system.DocumentProcessor')
-    def test_rag_system_initialization(self, mock_doc_processor, mock_ai_gen, mock_vector_store):
+    def test_rag_system_initialization(self, rag_env):
         """Test that RAG system initializes all components correctly"""
-        config = Config()
-        config.ANTHROPIC_API_KEY = "test-key"
+        config, mocks = rag_env
         
         rag_system = RAGSystem(config)
         
         # Verify all components were initialized
-        mock_vector_store.assert_called_once_with(
-            config.CHROMA_PATH, 
-            config.EMBEDDING_MODEL, 
+        mocks['VectorStore'].assert_called_once_with(
+            config.CHROMA_PATH,
+            config.EMBEDDING_MODEL,
             config.MAX_RESULTS
         )
-        mock_ai_gen.assert_called_once_with(
-            config.ANTHROPIC_API_KEY, 
+        mocks['AIGenerator'].assert_called_once_with(
+            config.ANTHROPIC_API_KEY,
             config.ANTHROPIC_MODEL
         )
-        mock_doc_processor.assert_called_once_with(
-            config.CHUNK_SIZE, 
+        mocks['DocumentProcessor'].assert_called_once_with(
+            config.CHUNK_SIZE,
             config.CHUNK_OVERLAP
         )
         
@@ -47,42 +62,33 @@ class TestRAGSystemInitialization:
         assert len(rag_system.tool_manager.tools) == 1
         assert "search_course_content" in rag_system.tool_manager.tools
 
-    def test_tool_registration(self):
+    def test_tool_registration(self, rag_env):
         """Test that search tool is properly registered with tool manager"""
-        config = Config()
-        config.ANTHROPIC_API_KEY = "test-key"
+        config, _ = rag_env
         
-        with patch('rag_system.VectorStore'), \
-             patch('rag_system.AIGenerator'), \
-             patch('rag_system.DocumentProcessor'):
-            
-            rag_system = RAGSystem(config)
-            
-            tool_definitions = rag_system.tool_manager.get_tool_definitions()
-            assert len(tool_definitions) == 1
-            assert tool_definitions[0]["name"] == "search_course_content"
+        rag_system = RAGSystem(config)
+        
+        tool_definitions = rag_system.tool_manager.get_tool_definitions()
+        assert len(tool_definitions) == 1
+        assert tool_definitions[0]["name"] == "search_course_content"
 
 
 class TestQueryProcessing:
     """Test end-to-end query processing"""
     
-    @patch('rag_system.VectorStore')
-    @patch('rag_system.AIGenerator')
-    @patch('rag_system.DocumentProcessor')
-    def test_successful_query_processing(self, mock_doc_processor, mock_ai_gen_class, mock_vector_store_class):
+    def test_successful_query_processing(self, rag_env):
         """Test successful end-to-end query processing"""
+        config, mocks = rag_env
+        
         # Setup mocks
         mock_vector_store = Mock()
         mock_vector_store.search.return_value = MockTestData.get_sample_search_results()
         mock_vector_store.get_lesson_link.return_value = "https://example.com/lesson3"
-        mock_vector_store_class.return_value = mock_vector_store
+        mocks['VectorStore'].return_value = mock_vector_store
         
         mock_ai_gen = Mock()
         mock_ai_gen.generate_response.return_value = "Python decorators are powerful features for function enhancement."
-        mock_ai_gen_class.return_value = mock_ai_gen
-        
-        config = Config()
-        config.ANTHROPIC_API_KEY = "test-key"
+        mocks['AIGenerator'].return_value = mock_ai_gen
         
         rag_system = RAGSystem(config)
         
@@ -104,22 +110,18 @@ class TestQueryProcessing:
         # Verify sources were returned
         assert isinstance(sources, list)
 
-    @patch('rag_system.VectorStore')
-    @patch('rag_system.AIGenerator')
-    @patch('rag_system.DocumentProcessor')
-    def test_query_with_session_management(self, mock_doc_processor, mock_ai_gen_class, mock_vector_store_class):
+    def test_query_with_session_management(self, rag_env):
         """Test query processing with session management"""
+        config, mocks = rag_env
+        
         # Setup mocks
         mock_vector_store = Mock()
         mock_vector_store.search.return_value = MockTestData.get_sample_search_results()
-        mock_vector_store_class.return_value = mock_vector_store
+        mocks['VectorStore'].return_value = mock_vector_store
         
         mock_ai_gen = Mock()
         mock_ai_gen.generate_response.return_value = "Response with session context"
-        mock_ai_gen_class.return_value = mock_ai_gen
-        
-        config = Config()
-        config.ANTHROPIC_API_KEY = "test-key"
+        mocks['AIGenerator'].return_value = mock_ai_gen
         
         rag_system = RAGSystem(config)
         
@@ -139,21 +141,16 @@ class TestQueryProcessing:
         second_call_args = mock_ai_gen.generate_response.call_args_list[1]
         assert second_call_args[1]["conversation_history"] is not None
 
-    @patch('rag_system.VectorStore')
-    @patch('rag_system.AIGenerator')
-    @patch('rag_system.DocumentProcessor')
-    def test_query_processing_error_handling(self, mock_doc_processor, mock_ai_gen_class, mock_vector_store_class):
+    def test_query_processing_error_handling(self, rag_env):
         """Test error handling in query processing"""
+        config, mocks = rag_env
+        
         # Setup mocks to simulate AI generator error
-        mock_vector_store = Mock()
-        mock_vector_store_class.return_value = mock_vector_store
+        mocks['VectorStore'].return_value = Mock()
         
         mock_ai_gen = Mock()
         mock_ai_gen.generate_response.side_effect = Exception("AI generation failed")
-        mock_ai_gen_class.return_value = mock_ai_gen
-        
-        config = Config()
-        config.ANTHROPIC_API_KEY = "test-key"
+        mocks['AIGenerator'].return_value = mock_ai_gen
         
         rag_system = RAGSystem(config)
         
@@ -161,22 +158,18 @@ class TestQueryProcessing:
         with pytest.raises(Exception, match="AI generation failed"):
             rag_system.query("Test query")
 
-    @patch('rag_system.VectorStore')
-    @patch('rag_system.AIGenerator')
-    @patch('rag_system.DocumentProcessor')
-    def test_source_cleanup_after_query(self, mock_doc_processor, mock_ai_gen_class, mock_vector_store_class):
+    def test_source_cleanup_after_query(self, rag_env):
         """Test that sources are properly cleaned up after query"""
+        config, mocks = rag_env
+        
         # Setup mocks
         mock_vector_store = Mock()
         mock_vector_store.search.return_value = MockTestData.get_sample_search_results()
-        mock_vector_store_class.return_value = mock_vector_store
+        mocks['VectorStore'].return_value = mock_vector_store
         
         mock_ai_gen = Mock()
         mock_ai_gen.generate_response.return_value = "Test response"
-        mock_ai_gen_class.return_value = mock_ai_gen
-        
-        config = Config()
-        config.ANTHROPIC_API_KEY = "test-key"
+        mocks['AIGenerator'].return_value = mock_ai_gen
         
         rag_system = RAGSystem(config)
         
@@ -190,145 +183,274 @@ class TestQueryProcessing:
         assert rag_system.search_tool.last_sources == []
 
 
+    @pytest.mark.asyncio
+    async def test_async_query_processing(self, rag_env):
+        """Test async query processing with session management"""
+        config, mocks = rag_env
+        mocks['VectorStore'].return_value = Mock()
+        
+        mock_ai_gen = Mock()
+        mock_ai_gen.agenerate_response = AsyncMock(return_value="Async response")
+        mocks['AIGenerator'].return_value = mock_ai_gen
+        
+        rag_system = RAGSystem(config)
+        
+        response, sources = await rag_system.aquery("What are decorators?", session_id="async_session")
+        
+        assert response == "Async response"
+        assert sources == []
+        
+        # Each async query gets its own tool manager so sources aren't shared
+        call_args = mock_ai_gen.agenerate_response.call_args
+        assert call_args[1]["tool_manager"] is not rag_system.tool_manager
+        assert call_args[1]["tools"] == rag_system.tool_manager.get_tool_definitions()
+        
+        history = rag_system.session_manager.get_conversation_history("async_session")
+        assert "What are decorators?" in history
+
+
+    @pytest.mark.asyncio
+    async def test_async_query_embeds_off_event_loop(self, rag_env):
+        """Test that the response cache embeds queries on a worker thread, not the event loop"""
+        config, mocks = rag_env
+        
+        embedding_threads = []
+        
+        def embed(texts):
+            embedding_threads.append(threading.get_ident())
+            return [[1.0, 0.0] for _ in texts]
+        
+        mock_vector_store = Mock()
+        mock_vector_store.embedding_function.side_effect = embed
+        mocks['VectorStore'].return_value = mock_vector_store
+        
+        mock_ai_gen = Mock()
+        mock_ai_gen.agenerate_response = AsyncMock(return_value="Async response")
+        mocks['AIGenerator'].return_value = mock_ai_gen
+        
+        rag_system = RAGSystem(replace(config, RESPONSE_CACHE_THRESHOLD=0.92))
+        
+        await rag_system.aquery("What are decorators?")
+        await rag_system.aquery("What are Python decorators?")
+        
+        assert embedding_threads
+        assert threading.get_ident() not in embedding_threads
+
+
+    @pytest.mark.asyncio
+    async def test_streaming_query_processing(self, rag_env):
+        """Test that a streamed query yields text deltas followed by sources"""
+        config, mocks = rag_env
+        mocks['VectorStore'].return_value = Mock()
+        
+        async def stream_response(**kwargs):
+            for chunk in ["Decorators ", "wrap ", "functions."]:
+                yield chunk
+        
+        mock_ai_gen = Mock()
+        mock_ai_gen.agenerate_response_stream = Mock(side_effect=stream_response)
+        mocks['AIGenerator'].return_value = mock_ai_gen
+        
+        rag_system = RAGSystem(config)
+        
+        events = [event async for event in rag_system.astream_query("What are decorators?", session_id="stream_session")]
+        
+        assert [event["text"] for event in events[:-1]] == ["Decorators ", "wrap ", "functions."]
+        assert events[-1] == {"type": "sources", "sources": []}
+        
+        # The full answer is recorded once streaming finishes
+        history = rag_system.session_manager.get_conversation_history("stream_session")
+        assert "Decorators wrap functions." in history
+
+
+    @pytest.mark.asyncio
+    async def test_streamed_partial_failure_not_cached(self, rag_env):
+        """Test that a streamed answer cut short by an API failure is not served from the cache"""
+        config, mocks = rag_env
+        
+        mock_vector_store = Mock()
+        mock_vector_store.embedding_function.side_effect = lambda texts: [[1.0, 0.0] for _ in texts]
+        mocks['VectorStore'].return_value = mock_vector_store
+        
+        async def stream_response(**kwargs):
+            for chunk in ["Decorators ", AIGenerator.FINAL_FAILURE_RESPONSE]:
+                yield chunk
+        
+        mock_ai_gen = Mock()
+        mock_ai_gen.agenerate_response_stream = Mock(side_effect=stream_response)
+        mocks['AIGenerator'].return_value = mock_ai_gen
+        
+        rag_system = RAGSystem(config)
+        
+        for _ in range(2):
+            [event async for event in rag_system.astream_query("What are decorators?")]
+        
+        assert mock_ai_gen.agenerate_response_stream.call_count == 2
+
+
+    def test_repeated_query_served_from_cache(self, rag_env):
+        """Test that a repeated question is answered from the response cache"""
+        config, mocks = rag_env
+        
+        mock_vector_store = Mock()
+        mock_vector_store.embedding_function.side_effect = lambda texts: [[1.0, 0.0] for _ in texts]
+        mocks['VectorStore'].return_value = mock_vector_store
+        
+        mock_ai_gen = Mock()
+        mock_ai_gen.generate_response.return_value = "Cached answer"
+        mocks['AIGenerator'].return_value = mock_ai_gen
+        
+        rag_system = RAGSystem(config)
+        rag_system.search_tool.last_sources = [{"display": "Test", "link": None}]
+        
+        first = rag_system.query("What are decorators?")
+        second = rag_system.query("What are decorators?")
+        
+        assert first == second == ("Cached answer", [{"display": "Test", "link": None}])
+        mock_ai_gen.generate_response.assert_called_once()
+
+
 class TestDocumentManagement:
     """Test document loading and management functionality"""
     
-    def test_add_course_document_success(self):
+    def test_add_course_document_success(self, rag_env):
         """Test successful course document addition"""
-        with patch('rag_system.VectorStore') as mock_vector_store_class, \
-             patch('rag_system.AIGenerator'), \
-             patch('rag_system.DocumentProcessor') as mock_doc_processor_class:
-            
-            # Setup mocks
-            mock_vector_store = Mock()
-            mock_vector_store_class.return_value = mock_vector_store
-            
-            mock_doc_processor = Mock()
-            sample_course = MockTestData.get_sample_courses()[0]
-            sample_chunks = MockTestData.get_sample_course_chunks()[:2]
-            mock_doc_processor.process_course_document.return_value = (sample_course, sample_chunks)
-            mock_doc_processor_class.return_value = mock_doc_processor
-            
-            config = Config()
-            config.ANTHROPIC_API_KEY = "test-key"
-            
-            rag_system = RAGSystem(config)
-            
-            # Add document
-            course, chunk_count = rag_system.add_course_document("/fake/path/course.pdf")
-            
-            # Verify results
-            assert course == sample_course
-            assert chunk_count == 2
-            
-            # Verify vector store operations
-            mock_vector_store.add_course_metadata.assert_called_once_with(sample_course)
-            mock_vector_store.add_course_content.assert_called_once_with(sample_chunks)
-
-    def test_add_course_document_error_handling(self):
+        config, mocks = rag_env
+        
+        # Setup mocks
+        mock_vector_store = Mock()
+        mocks['VectorStore'].return_value = mock_vector_store
+        
+        mock_doc_processor = Mock()
+        sample_course = MockTestData.get_sample_courses()[0]
+        sample_chunks = MockTestData.get_sample_course_chunks()[:2]
+        mock_doc_processor.process_course_document.return_value = (sample_course, sample_chunks)
+        mocks['DocumentProcessor'].return_value = mock_doc_processor
+        
+        rag_system = RAGSystem(config)
+        
+        # Add document
+        course, chunk_count = rag_system.add_course_document("/fake/path/course.pdf")
+        
+        # Verify results
+        assert course == sample_course
+        assert chunk_count == 2
+        
+        # Verify vector store operations
+        mock_vector_store.add_course_metadata.assert_called_once_with(sample_course)
+        mock_vector_store.add_course_content.assert_called_once_with(sample_chunks)
+
+    def test_add_course_document_error_handling(self, rag_env):
         """Test error handling when document processing fails"""
-        with patch('rag_system.VectorStore') as mock_vector_store_class, \
-             patch('rag_system.AIGenerator'), \
-             patch('rag_system.DocumentProcessor') as mock_doc_processor_class:
-            
-            # Setup mocks to simulate error
-            mock_vector_store_class.return_value = Mock()
-            
-            mock_doc_processor = Mock()
-            mock_doc_processor.process_course_document.side_effect = Exception("Processing failed")
-            mock_doc_processor_class.return_value = mock_doc_processor
-            
-            config = Config()
-            config.ANTHROPIC_API_KEY = "test-key"
-            
-            rag_system = RAGSystem(config)
-            
-            # Add document should handle error gracefully
-            course, chunk_count = rag_system.add_course_document("/fake/path/course.pdf")
-            
-            assert course is None
-            assert chunk_count == 0
+        config, mocks = rag_env
+        
+        # Setup mocks to simulate error
+        mocks['VectorStore'].return_value = Mock()
+        
+        mock_doc_processor = Mock()
+        mock_doc_processor.process_course_document.side_effect = Exception("Processing failed")
+        mocks['DocumentProcessor'].return_value = mock_doc_processor
+        
+        rag_system = RAGSystem(config)
+        
+        # Add document should handle error gracefully
+        course, chunk_count = rag_system.add_course_document("/fake/path/course.pdf")
+        
+        assert course is None
+        assert chunk_count == 0
 
-    @patch('os.path.exists')
-    @patch('os.listdir')
-    def test_add_course_folder_success(self, mock_listdir, mock_exists):
+    def test_add_course_folder_success(self, rag_env, tmp_path):
         """Test successful folder processing"""
-        with patch('rag_system.VectorStore') as mock_vector_store_class, \
-             patch('rag_system.AIGenerator'), \
-             patch('rag_system.DocumentProcessor') as mock_doc_processor_class:
-            
-            # Setup filesystem mocks
-            mock_exists.return_value = True
-            mock_listdir.return_value = ["course1.pdf", "course2.txt", "not_a_course.log"]
-            
-            # Setup component mocks
-            mock_vector_store = Mock()
-            mock_vector_store.get_existing_course_titles.return_value = []
-            mock_vector_store_class.return_value = mock_vector_store
-            
-            mock_doc_processor = Mock()
-            sample_courses = MockTestData.get_sample_courses()
-            sample_chunks = MockTestData.get_sample_course_chunks()
-            
-            # Return different courses for different files
-            mock_doc_processor.process_course_document.side_effect = [
-                (sample_courses[0], sample_chunks[:2]),  # course1.pdf
-                (sample_courses[1], sample_chunks[2:])   # course2.txt
-            ]
-            mock_doc_processor_class.return_value = mock_doc_processor
-            
-            config = Config()
-            config.ANTHROPIC_API_KEY = "test-key"
-            
-            rag_system = RAGSystem(config)
-            
-            # Process folder
-            total_courses, total_chunks = rag_system.add_course_folder("/fake/folder")
-            
-            # Verify results
-            assert total_courses == 2
-            assert total_chunks == 4  # 2 chunks per course
-            
-            # Verify both valid files were processed
-            assert mock_doc_processor.process_course_document.call_count == 2
+        config, mocks = rag_env
+        
+        # Setup a folder with two course documents and one unsupported file
+        for file_name in ["course1.pdf", "course2.txt", "not_a_course.log"]:
+            (tmp_path / file_name).write_text("content")
+        
+        # Setup component mocks
+        mock_vector_store = Mock()
+        mock_vector_store.has_course.return_value = False
+        mocks['VectorStore'].return_value = mock_vector_store
+        
+        mock_doc_processor = Mock()
+        sample_courses = MockTestData.get_sample_courses()
+        sample_chunks = MockTestData.get_sample_course_chunks()
+        
+        # Return different courses for different files
+        mock_doc_processor.process_course_document.side_effect = [
+            (sample_courses[0], sample_chunks[:2]),  # course1.pdf
+            (sample_courses[1], sample_chunks[2:])   # course2.txt
+        ]
+        mocks['DocumentProcessor'].return_value = mock_doc_processor
+        
+        rag_system = RAGSystem(config)
+        
+        # Process folder
+        total_courses, total_chunks = rag_system.add_course_folder(str(tmp_path))
+        
+        # Verify results
+        assert total_courses == 2
+        assert total_chunks == 4  # 2 chunks per course
+        
+        # Verify both valid files were processed
+        assert mock_doc_processor.process_course_document.call_count == 2
+
+    def test_add_course_folder_skips_existing_courses(self, rag_env, tmp_path):
+        """Test that courses already in the vector store are not added again"""
+        config, mocks = rag_env
+        
+        for file_name in ["course1.pdf", "course2.txt"]:
+            (tmp_path / file_name).write_text("content")
+        
+        sample_courses = MockTestData.get_sample_courses()
+        sample_chunks = MockTestData.get_sample_course_chunks()
+        
+        mock_vector_store = Mock()
+        mock_vector_store.has_course.side_effect = lambda title: title == sample_courses[0].title
+        mocks['VectorStore'].return_value = mock_vector_store
+        
+        mock_doc_processor = Mock()
+        mock_doc_processor.process_course_document.side_effect = lambda path: (
+            (sample_courses[0], sample_chunks[:2]) if path.endswith("course1.pdf")
+            else (sample_courses[1], sample_chunks[2:])
+        )
+        mocks['DocumentProcessor'].return_value = mock_doc_processor
+        
+        rag_system = RAGSystem(config)
+        
+        total_courses, total_chunks = rag_system.add_course_folder(str(tmp_path))
+        
+        assert (total_courses, total_chunks) == (1, 2)
+        mock_vector_store.add_course_metadata.assert_called_once_with(sample_courses[1])
+        mock_vector_store.get_existing_course_titles.assert_not_called()
 
     @patch('os.path.exists')
-    def test_add_course_folder_nonexistent_path(self, mock_exists):
+    def test_add_course_folder_nonexistent_path(self, mock_exists, rag_env):
         """Test handling of non-existent folder path"""
+        config, _ = rag_env
         mock_exists.return_value = False
         
-        with patch('rag_system.VectorStore'), \
-             patch('rag_system.AIGenerator'), \
-             patch('rag_system.DocumentProcessor'):
-            
-            config = Config()
-            config.ANTHROPIC_API_KEY = "test-key"
-            
-            rag_system = RAGSystem(config)
-            
-            total_courses, total_chunks = rag_system.add_course_folder("/nonexistent/folder")
-            
-            assert total_courses == 0
-            assert total_chunks == 0
+        rag_system = RAGSystem(config)
+        
+        total_courses, total_chunks = rag_system.add_course_folder("/nonexistent/folder")
+        
+        assert total_courses == 0
+        assert total_chunks == 0
 
 
 class TestCourseAnalytics:
     """Test course analytics functionality"""
     
-    @patch('rag_system.VectorStore')
-    @patch('rag_system.AIGenerator')
-    @patch('rag_system.DocumentProcessor')
-    def test_get_course_analytics(self, mock_doc_processor, mock_ai_gen, mock_vector_store_class):
+    def test_get_course_analytics(self, rag_env):
         """Test course analytics retrieval"""
+        config, mocks = rag_env
+        
         mock_vector_store = Mock()
         mock_vector_store.get_course_count.return_value = 3
         mock_vector_store.get_existing_course_titles.return_value = [
             "Course 1", "Course 2", "Course 3"
         ]
-        mock_vector_store_class.return_value = mock_vector_store
-        
-        config = Config()
-        config.ANTHROPIC_API_KEY = "test-key"
+        mocks['VectorStore'].return_value = mock_vector_store
         
         rag_system = RAGSystem(config)
         
@@ -345,63 +467,53 @@ class TestCourseAnalytics:
 class TestIntegrationWithRealComponents:
     """Integration tests with minimal mocking"""
     
-    def test_tool_manager_integration(self):
+    def test_tool_manager_integration(self, rag_env):
         """Test integration between RAG system and tool manager"""
-        with patch('rag_system.VectorStore') as mock_vector_store_class, \
-             patch('rag_system.AIGenerator') as mock_ai_gen_class, \
-             patch('rag_system.DocumentProcessor'):
-            
-            # Use real tool manager but mock other components
-            mock_vector_store = Mock()
-            mock_vector_store.search.return_value = MockTestData.get_sample_search_results()
-            mock_vector_store_class.return_value = mock_vector_store
-            
-            mock_ai_gen_class.return_value = Mock()
-            
-            config = Config()
-            config.ANTHROPIC_API_KEY = "test-key"
-            
-            rag_system = RAGSystem(config)
-            
-            # Test tool execution through tool manager
-            result = rag_system.tool_manager.execute_tool(
-                "search_course_content",
-                query="test query"
-            )
-            
-            # Should execute successfully
-            assert isinstance(result, str)
-            mock_vector_store.search.assert_called_once()
-
-    def test_session_manager_integration(self):
+        config, mocks = rag_env
+        
+        # Use real tool manager but mock other components
+        mock_vector_store = Mock()
+        mock_vector_store.search.return_value = MockTestData.get_sample_search_results()
+        mocks['VectorStore'].return_value = mock_vector_store
+        
+        mocks['AIGenerator'].return_value = Mock()
+        
+        rag_system = RAGSystem(config)
+        
+        # Test tool execution through tool manager
+        result = rag_system.tool_manager.execute_tool(
+            "search_course_content",
+            query="test query"
+        )
+        
+        # Should execute successfully
+        assert isinstance(result, str)
+        mock_vector_store.search.assert_called_once()
+
+    def test_session_manager_integration(self, rag_env):
         """Test integration with session manager"""
-        with patch('rag_system.VectorStore'), \
-             patch('rag_system.AIGenerator') as mock_ai_gen_class, \
-             patch('rag_system.DocumentProcessor'):
-            
-            mock_ai_gen = Mock()
-            mock_ai_gen.generate_response.return_value = "Test response"
-            mock_ai_gen_class.return_value = mock_ai_gen
-            
-            config = Config()
-            config.ANTHROPIC_API_KEY = "test-key"
-            config.MAX_HISTORY = 2
-            
-            rag_system = RAGSystem(config)
-            
-            session_id = "test_session"
-            
-            # First exchange
-            rag_system.query("First question", session_id)
-            
-            # Second exchange  
-            rag_system.query("Second question", session_id)
-            
-            # Third exchange - should have conversation history
-            rag_system.query("Third question", session_id)
-            
-            # Verify session manager stored the exchanges
-            history = rag_system.session_manager.get_conversation_history(session_id)
-            assert history is not None
-            assert "First question" in history
-            assert "Second question" in history
\ No newline at end of file
+        config, mocks = rag_env
+        
+        mock_ai_gen = Mock()
+        mock_ai_gen.generate_response.return_value = "Test response"
+        mocks['AIGenerator'].return_value = mock_ai_gen
+        
+        rag_system = RAGSystem(replace(config, MAX_HISTORY=2))
+        
+        session_id = "test_session"
+        
+        # First exchange
+        rag_system.query("First question", session_id)
+        
+        # Second exchange
+        rag_system.query("Second question", session_id)
+        
+        # Third exchange - should have conversation history
+        rag_system.query("Third question", session_id)
+        
+        # MAX_HISTORY=2 keeps the last two exchanges, so the first one was evicted
+        history = rag_system.session_manager.get_conversation_history(session_id)
+        assert history is not None
+        assert "First question" not in history
+        assert "Second question" in history
+        assert "Third question" in history
@@ -4,11 +4,12 @@ Unit tests for CourseSearchTool and ToolManager.
 These tests validate the search functionality, error handling, and result formatting
 of the course search tools.
 """
+import asyncio
+import threading
 import pytest
-from unittest.mock import Mock, patch
-from search_tools import CourseSearchTool, ToolManager, Tool
+from search_tools import CourseSearchTool, ToolManager
 from vector_store import SearchResults
-from .fixtures import MockTestData
+from .fixtures import MockTestData, StubTool
 
 
 class TestCourseSearchTool:
@@ -19,96 +20,45 @@ class TestCourseSearchTool:
         definition = course_search_tool.get_tool_definition()
         
         assert definition["name"] == "search_course_content"
-        assert "description" in definition
-        assert "input_schema" in definition
+        assert {"description", "input_schema"} <= definition.keys()
         assert definition["input_schema"]["type"] == "object"
         
-        properties = definition["input_schema"]["properties"]
-        assert "query" in properties
-        assert "course_name" in properties  
-        assert "lesson_number" in properties
-        
-        required_fields = definition["input_schema"]["required"]
-        assert "query" in required_fields
-        assert "course_name" not in required_fields  # Optional
-        assert "lesson_number" not in required_fields  # Optional
+        assert {"query", "course_name", "lesson_number"} <= definition["input_schema"]["properties"].keys()
+        # course_name and lesson_number are optional
+        assert set(definition["input_schema"]["required"]) == {"query"}
 
-    def test_execute_with_valid_query(self, course_search_tool, mock_vector_store):
-        """Test successful search execution with valid query"""
-        mock_vector_store.search.return_value = MockTestData.get_sample_search_results()
-        
-        result = course_search_tool.execute("python decorators")
+    @pytest.mark.parametrize("course_name,lesson_number,expected_header", [
+        pytest.param(None, None, "[Advanced Python Programming - Lesson 3]", id="no_filters"),
+        pytest.param("python", None, "Advanced Python Programming", id="course_filter"),
+        pytest.param(None, 3, "Lesson 3", id="lesson_filter"),
+        pytest.param("python", 3, "Advanced Python Programming - Lesson 3", id="combined_filters"),
+    ])
+    def test_execute_with_filters(self, course_search_tool, mock_vector_store,
+                                  course_name, lesson_number, expected_header):
+        """Test search execution passes filters through and formats the results"""
+        result = course_search_tool.execute("decorators", course_name=course_name, lesson_number=lesson_number)
         
         # Verify vector store was called with correct parameters
         mock_vector_store.search.assert_called_once_with(
-            query="python decorators",
-            course_name=None,
-            lesson_number=None
+            query="decorators",
+            course_name=course_name,
+            lesson_number=lesson_number
         )
         
         # Verify result formatting
         assert isinstance(result, str)
-        assert "[Advanced Python Programming - Lesson 3]" in result
+        assert expected_header in result
         assert "Python decorators are a powerful feature" in result
         assert "closure is a function" in result
 
-    def test_execute_with_course_filter(self, course_search_tool, mock_vector_store):
-        """Test search execution with course name filter"""
-        mock_vector_store.search.return_value = MockTestData.get_sample_search_results()
-        
-        result = course_search_tool.execute("decorators", course_name="python")
-        
-        mock_vector_store.search.assert_called_once_with(
-            query="decorators",
-            course_name="python", 
-            lesson_number=None
-        )
-        
-        assert isinstance(result, str)
-        assert "Advanced Python Programming" in result
-
-    def test_execute_with_lesson_filter(self, course_search_tool, mock_vector_store):
-        """Test search execution with lesson number filter"""
-        mock_vector_store.search.return_value = MockTestData.get_sample_search_results()
-        
-        result = course_search_tool.execute("decorators", lesson_number=3)
-        
-        mock_vector_store.search.assert_called_once_with(
-            query="decorators",
-            course_name=None,
-            lesson_number=3
-        )
-        
-        assert isinstance(result, str)
-        assert "Lesson 3" in result
-
-    def test_execute_with_combined_filters(self, course_search_tool, mock_vector_store):
-        """Test search execution with both course and lesson filters"""
-        mock_vector_store.search.return_value = MockTestData.get_sample_search_results()
-        
-        result = course_search_tool.execute("decorators", course_name="python", lesson_number=3)
-        
-        mock_vector_store.search.assert_called_once_with(
-            query="decorators",
-            course_name="python",
-            lesson_number=3
-        )
-        
-        assert isinstance(result, str)
-        assert "Advanced Python Programming - Lesson 3" in result
-
-    def test_execute_with_empty_results(self, course_search_tool_empty, mock_vector_store_empty):
-        """Test handling of empty search results"""
-        result = course_search_tool_empty.execute("nonexistent content")
-        
-        assert result == "No relevant content found."
-        
-        # Test with filters
-        result_with_course = course_search_tool_empty.execute("test", course_name="missing")
-        assert "No relevant content found in course 'missing'." == result_with_course
-        
-        result_with_lesson = course_search_tool_empty.execute("test", lesson_number=99)
-        assert "No relevant content found in lesson 99." == result_with_lesson
+    @pytest.mark.parametrize("filters,expected", [
+        pytest.param({}, "No relevant content found.", id="no_filters"),
+        pytest.param({"course_name": "missing"}, "No relevant content found in course 'missing'.", id="course_filter"),
+        pytest.param({"lesson_number": 99}, "No relevant content found in lesson 99.", id="lesson_filter"),
+    ])
+    def test_execute_with_empty_results(self, course_search_tool_empty, filters, expected):
+        """Test the empty-results message names the filters that were applied"""
+        assert course_search_tool_empty.execute("nonexistent content", **filters) == expected
 
     def test_execute_with_search_error(self, course_search_tool_error, mock_vector_store_error):
         """Test handling of search errors"""
@@ -118,9 +68,6 @@ class TestCourseSearchTool:
 
     def test_source_tracking(self, course_search_tool, mock_vector_store):
         """Test that sources are properly tracked for UI display"""
-        mock_vector_store.search.return_value = MockTestData.get_sample_search_results()
-        mock_vector_store.get_lesson_link.return_value = "https://example.com/lesson3"
-        
         # Execute search
         course_search_tool.execute("python decorators")
         
@@ -174,22 +121,20 @@ class TestToolManager:
     def test_register_tool(self):
         """Test tool registration"""
         manager = ToolManager()
-        mock_tool = Mock(spec=Tool)
-        mock_tool.get_tool_definition.return_value = {"name": "test_tool"}
+        stub_tool = StubTool({"name": "test_tool"})
         
-        manager.register_tool(mock_tool)
+        manager.register_tool(stub_tool)
         
         assert "test_tool" in manager.tools
-        assert manager.tools["test_tool"] == mock_tool
+        assert manager.tools["test_tool"] is stub_tool
 
     def test_register_tool_without_name(self):
         """Test error handling when tool definition lacks name"""
         manager = ToolManager()
-        mock_tool = Mock(spec=Tool)
-        mock_tool.get_tool_definition.return_value = {"description": "No name"}
+        stub_tool = StubTool({"description": "No name"})
         
         with pytest.raises(ValueError, match="Tool must have a 'name'"):
-            manager.register_tool(mock_tool)
+            manager.register_tool(stub_tool)
 
     def test_get_tool_definitions(self, tool_manager):
         """Test retrieving all tool definitions"""
@@ -199,16 +144,47 @@ class TestToolManager:
         assert len(definitions) == 1
         assert definitions[0]["name"] == "search_course_content"
 
-    def test_execute_tool_success(self, tool_manager):
+    def test_execute_tool_success(self):
         """Test successful tool execution"""
-        # Mock the tool's execute method
-        tool = tool_manager.tools["search_course_content"]
-        tool.execute.return_value = "Search completed successfully"
+        manager = ToolManager()
+        tool = StubTool({"name": "search_course_content"}, result="Search completed successfully")
+        manager.register_tool(tool)
         
-        result = tool_manager.execute_tool("search_course_content", query="test")
+        result = manager.execute_tool("search_course_content", query="test")
         
         assert result == "Search completed successfully"
-        tool.execute.assert_called_once_with(query="test")
+        assert tool.calls == [{"query": "test"}]
+
+    @pytest.mark.asyncio
+    async def test_aexecute_tool(self, tool_manager, mock_vector_store):
+        """Test async tool execution delegates to the sync tool"""
+        result = await tool_manager.aexecute_tool("search_course_content", query="python decorators")
+        
+        assert "[Advanced Python Programming - Lesson 3]" in result
+        mock_vector_store.search.assert_called_once_with(
+            query="python decorators",
+            course_name=None,
+            lesson_number=None
+        )
+
+    @pytest.mark.asyncio
+    async def test_aexecute_tool_searches_concurrently(self, tool_manager, mock_vector_store):
+        """Test gathered async tool calls run their vector store searches in parallel"""
+        both_searching = threading.Barrier(2, timeout=5)
+        
+        def search(**kwargs):
+            # Searches run one after another would break the barrier here
+            both_searching.wait()
+            return MockTestData.get_sample_search_results()
+        
+        mock_vector_store.search.side_effect = search
+        
+        results = await asyncio.gather(
+            tool_manager.aexecute_tool("search_course_content", query="decorators"),
+            tool_manager.aexecute_tool("search_course_content", query="closures")
+        )
+        
+        assert all("[Advanced Python Programming - Lesson 3]" in result for result in results)
 
     def test_execute_nonexistent_tool(self, tool_manager):
         """Test execution of non-existent tool"""
@@ -252,23 +228,13 @@ class TestToolManager:
     def test_multiple_tools_registration(self):
         """Test registering multiple tools"""
         manager = ToolManager()
+        names = ["tool1", "tool2"]
         
-        # Create two mock tools
-        tool1 = Mock(spec=Tool)
-        tool1.get_tool_definition.return_value = {"name": "tool1"}
-        
-        tool2 = Mock(spec=Tool) 
-        tool2.get_tool_definition.return_value = {"name": "tool2"}
-        
-        manager.register_tool(tool1)
-        manager.register_tool(tool2)
-        
-        assert len(manager.tools) == 2
-        assert "tool1" in manager.tools
-        assert "tool2" in manager.tools
+        for name in names:
+            manager.register_tool(StubTool({"name": name}))
         
-        definitions = manager.get_tool_definitions()
-        assert len(definitions) == 2
+        assert set(manager.tools) == set(names)
+        assert [definition["name"] for definition in manager.get_tool_definitions()] == names
 
 
 class TestEdgeCases:
@@ -0,0 +1,155 @@
+"""
+Unit tests for SemanticCache.
+
+These tests validate similarity matching, conversation-context isolation,
+and eviction of the semantic response cache.
+"""
+import threading
+import numpy as np
+import pytest
+from semantic_cache import SemanticCache
+
+
+class FakeEmbeddingFunction:
+    """Deterministic embedding function that records how often it is called"""
+    
+    VECTORS = {
+        "What are Python decorators?": [1.0, 0.0, 0.0],
+        "what are python decorators": [0.98, 0.2, 0.0],
+        "What is linear regression?": [0.0, 1.0, 0.0],
+        "Explain closures": [0.0, 0.0, 1.0],
+        "What is covered in lesson 1 of the MCP course?": [0.6, 0.6, 0.5],
+        "What is covered in lesson 2 of the MCP course?": [0.6, 0.6, 0.52],
+    }
+    
+    def __init__(self):
+        self.calls = 0
+    
+    def __call__(self, texts):
+        self.calls += 1
+        return [self.VECTORS[text] for text in texts]
+
+
+@pytest.fixture
+def embedding_function():
+    return FakeEmbeddingFunction()
+
+
+@pytest.fixture
+def cache(embedding_function):
+    return SemanticCache(embedding_function, threshold=0.92, max_entries=2)
+
+
+class TestSemanticCache:
+    """Test cases for SemanticCache"""
+
+    def test_miss_on_empty_cache_skips_embedding(self, cache, embedding_function):
+        """Test that a lookup against an empty cache doesn't embed the query"""
+        assert cache.lookup("What are Python decorators?") is None
+        assert embedding_function.calls == 0
+
+    def test_hit_for_semantically_equivalent_query(self, cache):
+        """Test that a near-duplicate query returns the cached value"""
+        cache.insert("What are Python decorators?", None, ("Decorators wrap functions", []))
+        
+        assert cache.lookup("what are python decorators") == ("Decorators wrap functions", [])
+
+    def test_miss_for_unrelated_query(self, cache):
+        """Test that a dissimilar query is not served from the cache"""
+        cache.insert("What are Python decorators?", None, ("Decorators wrap functions", []))
+        
+        assert cache.lookup("What is linear regression?") is None
+
+    def test_exact_repeat_skips_embedding(self, cache, embedding_function):
+        """Test that exact repeats are answered without embedding the query"""
+        cache.insert("What are Python decorators?", None, "answer")
+        calls_after_insert = embedding_function.calls
+        
+        assert cache.lookup("What are Python decorators?") == "answer"
+        assert embedding_function.calls == calls_after_insert
+
+    def test_conversation_history_isolates_entries(self, cache):
+        """Test that answers generated with different history are not mixed"""
+        cache.insert("What are Python decorators?", "User: Hi\nAssistant: Hello", "with history")
+        
+        assert cache.lookup("What are Python decorators?") is None
+        assert cache.lookup("What are Python decorators?", "User: Hi\nAssistant: Hello") == "with history"
+
+    def test_oldest_entry_evicted(self, cache):
+        """Test that the cache holds at most max_entries values"""
+        cache.insert("What are Python decorators?", None, "first")
+        cache.insert("What is linear regression?", None, "second")
+        cache.insert("Explain closures", None, "third")
+        
+        assert cache.lookup("What are Python decorators?") is None
+        assert cache.lookup("Explain closures") == "third"
+
+    def test_different_numbers_never_share_an_answer(self, cache):
+        """Test that questions about different lessons miss even when their embeddings are near-identical"""
+        cache.insert("What is covered in lesson 1 of the MCP course?", None, "Lesson 1 answer")
+        
+        assert cache.lookup("What is covered in lesson 2 of the MCP course?") is None
+        assert cache.lookup("What is covered in lesson 1 of the MCP course?") == "Lesson 1 answer"
+
+    def test_default_serves_only_repeated_questions(self, embedding_function):
+        """Test that without a threshold only case and whitespace variants hit, and nothing is embedded"""
+        cache = SemanticCache(embedding_function)
+        cache.insert("What are Python decorators?", None, "answer")
+        
+        assert cache.lookup("  what are PYTHON   decorators?") == "answer"
+        assert cache.lookup("what are python decorators") is None
+        assert embedding_function.calls == 0
+
+    def test_disabled_cache(self, embedding_function):
+        """Test that max_entries=0 disables caching"""
+        cache = SemanticCache(embedding_function, max_entries=0)
+        cache.insert("What are Python decorators?", None, "answer")
+        
+        assert cache.lookup("What are Python decorators?") is None
+        assert embedding_function.calls == 0
+
+    def test_embedding_error_logged_as_miss(self, caplog):
+        """Test that an embedding failure is logged and treated as a cache miss"""
+        def failing_embedding(texts):
+            raise RuntimeError("model unavailable")
+        
+        cache = SemanticCache(failing_embedding, threshold=0.92)
+        
+        with caplog.at_level("WARNING", logger="semantic_cache"):
+            cache.insert("What are Python decorators?", None, "answer")
+        
+        assert cache.lookup("What are Python decorators?") is None
+        assert "model unavailable" in caplog.text
+
+    def test_clear(self, cache):
+        """Test clearing all cached entries"""
+        cache.insert("What are Python decorators?", None, "answer")
+        cache.clear()
+        
+        assert cache.lookup("What are Python decorators?") is None
+
+    @pytest.mark.parametrize("other_thread", ["embed", "clear"])
+    def test_reused_embedding_survives_other_threads(self, other_thread):
+        """Test that another thread replacing the last embedding mid-check can't leak into the result"""
+        queries = ["Question 0", "Question 1"]
+        
+        def one_hot(texts):
+            return [[1.0 if query == text else 0.0 for query in queries] for text in texts]
+        
+        cache = SemanticCache(one_hot, threshold=0.92)
+        expected = cache._embed("Question 0")
+        
+        class InterleavedQuery(str):
+            """Query whose comparison lets another thread run, as a thread switch would"""
+            __hash__ = str.__hash__
+            
+            def __eq__(self, other):
+                target = (lambda: cache._embed("Question 1")) if other_thread == "embed" else cache.clear
+                worker = threading.Thread(target=target)
+                worker.start()
+                worker.join()
+                return str.__eq__(self, other)
+        
+        embedding = cache._embed(InterleavedQuery("Question 0"))
+        
+        np.testing.assert_array_equal(embedding, expected)
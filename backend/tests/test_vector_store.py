@@ -4,11 +4,52 @@ Unit tests for VectorStore functionality.
 These tests validate the ChromaDB integration, search functionality,
 and data management operations of the VectorStore component.
 """
-import pytest
-from unittest.mock import Mock, patch, MagicMock
+from unittest.mock import Mock, patch
+import threading
+from types import GeneratorType, SimpleNamespace
+import vector_store
 from vector_store import VectorStore, SearchResults
-from .fixtures import MockTestData, MockChromaResponse
+from models import CourseChunk
+from .fixtures import MockTestData, MockChromaResponse, FakeCollection
 import json
+import pytest
+
+
+@pytest.fixture(scope="module")
+def _chroma_patches():
+    """Patch the ChromaDB client and embedding function once for the whole module"""
+    # Plain Mock classes: resetting a MagicMock's side effects would also wipe its default __eq__
+    with patch('chromadb.PersistentClient', new_callable=Mock) as client_class, \
+         patch('chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction', new_callable=Mock):
+        vector_store._get_embedding_function.cache_clear()
+        store = VectorStore("/test/path", "test-model")
+        yield SimpleNamespace(
+            store=store,
+            client=client_class.return_value,
+            embedding_function=store.embedding_function
+        )
+    vector_store._get_embedding_function.cache_clear()
+
+
+@pytest.fixture
+def store_mocks(_chroma_patches):
+    """Module-wide VectorStore with its client reset and fresh fake collections for this test"""
+    mocks = _chroma_patches
+    mocks.client.reset_mock(return_value=True, side_effect=True)
+    mocks.embedding_function.reset_mock(return_value=True, side_effect=True)
+    mocks.embedding_function.side_effect = lambda texts: [[0.1, 0.2] for _ in texts]
+    mocks.catalog = FakeCollection()
+    mocks.content = FakeCollection()
+    mocks.client.get_or_create_collection.side_effect = lambda name, **kwargs: (
+        mocks.catalog if name == "course_catalog" else mocks.content
+    )
+    
+    # Undo anything a previous test changed on the shared store
+    mocks.store.max_results = 5
+    mocks.store.course_catalog = mocks.catalog
+    mocks.store.course_content = mocks.content
+    mocks.store.clear_caches()
+    return mocks
 
 
 class TestSearchResults:
@@ -27,7 +68,7 @@ class TestSearchResults:
         assert results.distances == [0.1, 0.2]
         assert results.error is None
         assert not results.is_empty()
-
+    
     def test_search_results_from_chroma(self):
         """Test creating SearchResults from ChromaDB response"""
         chroma_response = MockChromaResponse.successful_query_response()
@@ -38,7 +79,17 @@ class TestSearchResults:
         assert len(results.metadata) == 2
         assert len(results.distances) == 2
         assert results.error is None
-
+    
+    def test_iter_results_is_lazy(self):
+        """iter_results yields aligned (document, metadata, distance) tuples on demand"""
+        results = SearchResults.from_chroma(MockChromaResponse.successful_query_response())
+        
+        hits = results.iter_results()
+        
+        assert isinstance(hits, GeneratorType)
+        assert next(hits) == (results.documents[0], results.metadata[0], results.distances[0])
+        assert list(hits) == list(zip(results.documents, results.metadata, results.distances))[1:]
+    
     def test_search_results_empty(self):
         """Test empty SearchResults"""
         results = SearchResults.empty("No results found")
@@ -48,7 +99,7 @@ class TestSearchResults:
         assert results.documents == []
         assert results.metadata == []
         assert results.distances == []
-
+    
     def test_search_results_from_empty_chroma(self):
         """Test creating SearchResults from empty ChromaDB response"""
         chroma_response = MockChromaResponse.empty_query_response()
@@ -58,7 +109,24 @@ class TestSearchResults:
         assert results.is_empty()
         assert len(results.documents) == 0
 
+    def test_search_results_from_batched_chroma(self):
+        """Test picking each query's results out of a multi-query ChromaDB response"""
+        chroma_response = {
+            'documents': [["a1", "a2"], ["b1"]],
+            'metadatas': [[{"course_title": "A"}, {"course_title": "A"}], [{"course_title": "B"}]],
+            'distances': [[0.1, 0.2], [0.3]]
+        }
+        
+        first = SearchResults.from_chroma(chroma_response)
+        second = SearchResults.from_chroma(chroma_response, 1)
+        
+        assert first.documents == ["a1", "a2"]
+        assert first.distances == [0.1, 0.2]
+        assert second.documents == ["b1"]
+        assert second.metadata == [{"course_title": "B"}]
 
+
+@pytest.mark.usefixtures("fresh_embedding_functions")
 class TestVectorStoreInitialization:
     """Test VectorStore initialization"""
     
@@ -88,417 +156,436 @@ class TestVectorStoreInitialization:
         # Verify configuration
         assert vector_store.max_results == 10
 
-
-class TestVectorStoreSearch:
-    """Test VectorStore search functionality"""
-    
     @patch('chromadb.PersistentClient')
     @patch('chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
-    def test_search_without_filters(self, mock_embedding_func, mock_client_class):
-        """Test basic search without any filters"""
-        # Setup mocks
-        mock_client = Mock()
-        mock_client_class.return_value = mock_client
-        
-        mock_catalog = Mock()
-        mock_content = Mock()
-        mock_content.query.return_value = MockChromaResponse.successful_query_response()
-        
-        mock_client.get_or_create_collection.side_effect = [mock_catalog, mock_content]
-        
-        vector_store = VectorStore("/test/path", "test-model")
-        
-        # Perform search
-        results = vector_store.search("test query")
-        
-        # Verify search was called correctly
-        mock_content.query.assert_called_once_with(
-            query_texts=["test query"],
-            n_results=5,  # default max_results
-            where=None
-        )
-        
-        # Verify results
-        assert not results.is_empty()
-        assert len(results.documents) == 2
+    def test_embedding_function_cached_across_instances(self, mock_embedding_func, mock_client_class):
+        """Test stores using the same model share one embedding function"""
+        first = VectorStore("/test/path", "test-model")
+        second = VectorStore("/other/path", "test-model")
+        VectorStore("/test/path", "other-model")
+        
+        assert second.embedding_function is first.embedding_function
+        # Loaded once per model
+        models = [call.kwargs["model_name"] for call in mock_embedding_func.call_args_list]
+        assert models == ["test-model", "other-model"]
 
     @patch('chromadb.PersistentClient')
     @patch('chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
-    def test_search_with_course_name_filter(self, mock_embedding_func, mock_client_class):
-        """Test search with course name filtering"""
-        # Setup mocks
-        mock_client = Mock()
-        mock_client_class.return_value = mock_client
-        
-        mock_catalog = Mock()
-        mock_catalog.query.return_value = MockChromaResponse.course_catalog_response()
+    def test_executor_shared_across_instances(self, mock_embedding_func, mock_client_class):
+        """Test stores share one worker pool instead of starting threads per instance"""
+        first = VectorStore("/test/path", "test-model")
+        second = VectorStore("/other/path", "other-model")
         
-        mock_content = Mock()
-        mock_content.query.return_value = MockChromaResponse.successful_query_response()
-        
-        mock_client.get_or_create_collection.side_effect = [mock_catalog, mock_content]
-        
-        vector_store = VectorStore("/test/path", "test-model")
-        
-        # Perform search with course filter
-        results = vector_store.search("decorators", course_name="python")
-        
-        # Verify course catalog was queried for resolution
-        mock_catalog.query.assert_called_once_with(
-            query_texts=["python"],
-            n_results=1
-        )
-        
-        # Verify content search with filter
-        mock_content.query.assert_called_once()
-        call_args = mock_content.query.call_args
-        assert call_args[1]['where'] == {"course_title": "Advanced Python Programming"}
+        assert second._executor is first._executor
 
-    @patch('chromadb.PersistentClient')
-    @patch('chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
-    def test_search_with_lesson_number_filter(self, mock_embedding_func, mock_client_class):
-        """Test search with lesson number filtering"""
-        # Setup mocks
-        mock_client = Mock()
-        mock_client_class.return_value = mock_client
-        
-        mock_catalog = Mock()
-        mock_content = Mock()
-        mock_content.query.return_value = MockChromaResponse.successful_query_response()
-        
-        mock_client.get_or_create_collection.side_effect = [mock_catalog, mock_content]
-        
-        vector_store = VectorStore("/test/path", "test-model")
+class TestVectorStoreSearch:
+    """Test VectorStore search functionality"""
+    
+    @pytest.mark.parametrize("course_name,lesson_number,expected_where", [
+        pytest.param(None, None, None, id="no_filters"),
+        pytest.param("python", None, {"course_title": "Advanced Python Programming"}, id="course_filter"),
+        pytest.param(None, 3, {"lesson_number": 3}, id="lesson_filter"),
+        pytest.param("python", 3, {"$and": [
+            {"course_title": "Advanced Python Programming"},
+            {"lesson_number": 3}
+        ]}, id="combined_filters"),
+    ])
+    def test_search_filters(self, store_mocks, course_name, lesson_number, expected_where):
+        """Test search resolves the course name and passes the matching filter to the content query"""
+        store_mocks.catalog.query_result = MockChromaResponse.course_catalog_response()
+        store_mocks.content.query_result = MockChromaResponse.successful_query_response()
+        
+        results = store_mocks.store.search("decorators", course_name=course_name, lesson_number=lesson_number)
+        
+        # The course catalog is only queried to resolve a course name
+        expected_catalog_queries = [{"query_texts": ["python"], "n_results": 1}] if course_name else []
+        assert store_mocks.catalog.queries == expected_catalog_queries
+        
+        # Queries are embedded up front only while a course name resolves
+        [query] = store_mocks.content.queries
+        assert ("query_embeddings" if course_name else "query_texts") in query
+        assert query['where'] == expected_where
+        assert query['n_results'] == 5  # default max_results
+        assert len(results.documents) == 2
+    
+    def test_search_course_not_found(self, store_mocks):
+        """Test search when course name cannot be resolved"""
+        store_mocks.catalog.query_result = MockChromaResponse.empty_query_response()
         
-        # Perform search with lesson filter
-        results = vector_store.search("decorators", lesson_number=3)
+        # Perform search with non-existent course
+        results = store_mocks.store.search("decorators", course_name="nonexistent")
         
-        # Verify content search with lesson filter
-        mock_content.query.assert_called_once()
-        call_args = mock_content.query.call_args
-        assert call_args[1]['where'] == {"lesson_number": 3}
+        # Should return error results
+        assert not results.is_empty() or results.error is not None
+        if results.error:
+            assert "No course found matching 'nonexistent'" in results.error
+    
+    @pytest.mark.parametrize("course_name", ["python", "ADVANCED PYTHON PROGRAMMING"])
+    def test_course_name_resolved_without_catalog_query(self, store_mocks, course_name):
+        """Test a course name that matches one stored title is resolved without vector search"""
+        store_mocks.catalog.get_result = {'ids': ["Advanced Python Programming", "Machine Learning Fundamentals"]}
+        store_mocks.content.query_result = MockChromaResponse.successful_query_response()
+        
+        store_mocks.store.search("decorators", course_name=course_name)
+        store_mocks.store.search("closures", course_name=course_name)
+        
+        assert store_mocks.catalog.queries == []
+        # Titles are loaded once, not per search
+        assert store_mocks.catalog.gets == [{"include": []}]
+        assert [query['where'] for query in store_mocks.content.queries] == [
+            {"course_title": "Advanced Python Programming"}
+        ] * 2
 
-    @patch('chromadb.PersistentClient')
-    @patch('chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
-    def test_search_with_combined_filters(self, mock_embedding_func, mock_client_class):
-        """Test search with both course name and lesson number filters"""
-        # Setup mocks
-        mock_client = Mock()
-        mock_client_class.return_value = mock_client
-        
-        mock_catalog = Mock()
-        mock_catalog.query.return_value = MockChromaResponse.course_catalog_response()
+    def test_ambiguous_course_name_uses_vector_search(self, store_mocks):
+        """Test a course name matching several titles falls back to the catalog query"""
+        store_mocks.catalog.get_result = {'ids': ["Advanced Python Programming", "Python Basics"]}
+        store_mocks.catalog.query_result = MockChromaResponse.course_catalog_response()
+        store_mocks.content.query_result = MockChromaResponse.successful_query_response()
         
-        mock_content = Mock()
-        mock_content.query.return_value = MockChromaResponse.successful_query_response()
+        store_mocks.store.search("decorators", course_name="python")
         
-        mock_client.get_or_create_collection.side_effect = [mock_catalog, mock_content]
+        assert store_mocks.catalog.queries == [{"query_texts": ["python"], "n_results": 1}]
+
+    def test_blank_course_name_not_matched_locally(self, store_mocks):
+        """Test a whitespace-only course name isn't matched to the only stored title"""
+        store_mocks.catalog.get_result = {'ids': ["Advanced Python Programming"]}
+        store_mocks.catalog.query_result = MockChromaResponse.course_catalog_response()
+        store_mocks.content.query_result = MockChromaResponse.successful_query_response()
         
-        vector_store = VectorStore("/test/path", "test-model")
+        assert store_mocks.store._match_course_title("   ") is None
         
-        # Perform search with combined filters
-        results = vector_store.search("decorators", course_name="python", lesson_number=3)
+        store_mocks.store.search("decorators", course_name="   ")
         
-        # Verify content search with combined filter
-        mock_content.query.assert_called_once()
-        call_args = mock_content.query.call_args
-        expected_filter = {"$and": [
-            {"course_title": "Advanced Python Programming"},
-            {"lesson_number": 3}
-        ]}
-        assert call_args[1]['where'] == expected_filter
+        assert store_mocks.catalog.queries == [{"query_texts": ["   "], "n_results": 1}]
 
-    @patch('chromadb.PersistentClient')
-    @patch('chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
-    def test_search_course_not_found(self, mock_embedding_func, mock_client_class):
-        """Test search when course name cannot be resolved"""
-        # Setup mocks
-        mock_client = Mock()
-        mock_client_class.return_value = mock_client
+    def test_search_embeds_query_while_resolving_course(self, store_mocks, monkeypatch):
+        """Test the query is embedded concurrently with course name resolution"""
+        embedding_started = threading.Event()
+        
+        def embed(texts):
+            embedding_started.set()
+            return [[0.1, 0.2] for _ in texts]
+        
+        def resolve(course_name):
+            # Serial code would only embed after this returns
+            assert embedding_started.wait(timeout=5)
+            return "Advanced Python Programming"
+        
+        monkeypatch.setattr(store_mocks.store, "embedding_function", embed)
+        monkeypatch.setattr(store_mocks.store, "_resolve_course_name", resolve)
+        store_mocks.content.query_result = MockChromaResponse.successful_query_response()
+        
+        results = store_mocks.store.search("decorators", course_name="python")
+        
+        assert store_mocks.content.queries == [{
+            "query_embeddings": [[0.1, 0.2]],
+            "n_results": 5,
+            "where": {"course_title": "Advanced Python Programming"}
+        }]
+        assert len(results.documents) == 2
+
+    def test_search_with_custom_limit(self, store_mocks):
+        """Test search with custom result limit"""
+        store_mocks.content.query_result = MockChromaResponse.successful_query_response()
         
-        mock_catalog = Mock()
-        mock_catalog.query.return_value = MockChromaResponse.empty_query_response()
+        # Perform search with custom limit
+        store_mocks.store.search("test query", limit=10)
         
-        mock_content = Mock()
+        # Verify custom limit was used
+        [query] = store_mocks.content.queries
+        assert query['n_results'] == 10
+    
+    def test_search_error_handling(self, store_mocks):
+        """Test search error handling"""
+        store_mocks.content.error = Exception("Database connection failed")
         
-        mock_client.get_or_create_collection.side_effect = [mock_catalog, mock_content]
+        # Perform search that will fail
+        results = store_mocks.store.search("test query")
         
-        vector_store = VectorStore("/test/path", "test-model")
+        # Should return error results
+        assert results.error is not None
+        assert "Search error: Database connection failed" in results.error
+
+    def test_batch_search_single_chroma_call(self, store_mocks):
+        """Test batch search sends every query in one content query and splits the results"""
+        store_mocks.content.query_result = {
+            'documents': [["doc q1"], ["doc q2"], []],
+            'metadatas': [[{"course_title": "A"}], [{"course_title": "B"}], []],
+            'distances': [[0.1], [0.2], []]
+        }
         
-        # Perform search with non-existent course
-        results = vector_store.search("decorators", course_name="nonexistent")
+        results = store_mocks.store.batch_search(["q1", "q2", "q3"], lesson_number=3)
         
-        # Should return error results
-        assert not results.is_empty() or results.error is not None
-        if results.error:
-            assert "No course found matching 'nonexistent'" in results.error
+        assert store_mocks.content.queries == [{
+            "query_texts": ["q1", "q2", "q3"],
+            "n_results": 5,
+            "where": {"lesson_number": 3}
+        }]
+        assert [r.documents for r in results] == [["doc q1"], ["doc q2"], []]
+        assert results[2].is_empty()
 
-    @patch('chromadb.PersistentClient')
-    @patch('chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
-    def test_search_with_custom_limit(self, mock_embedding_func, mock_client_class):
-        """Test search with custom result limit"""
-        # Setup mocks
-        mock_client = Mock()
-        mock_client_class.return_value = mock_client
+    def test_batch_search_only_queries_uncached(self, store_mocks):
+        """Test batch search reuses cached results and only queries the rest"""
+        store_mocks.content.query_result = MockChromaResponse.successful_query_response()
+        cached = store_mocks.store.search("q1")
         
-        mock_catalog = Mock()
-        mock_content = Mock()
-        mock_content.query.return_value = MockChromaResponse.successful_query_response()
+        results = store_mocks.store.batch_search(["q1", "q2"])
         
-        mock_client.get_or_create_collection.side_effect = [mock_catalog, mock_content]
+        assert results[0] is cached
+        assert store_mocks.content.queries[-1]["query_texts"] == ["q2"]
+        assert len(results[1].documents) == 2
+
+    def test_search_cache_hit(self, store_mocks):
+        """Test a repeated search is answered from the cache"""
+        store_mocks.catalog.query_result = MockChromaResponse.course_catalog_response()
+        store_mocks.content.query_result = MockChromaResponse.successful_query_response()
         
-        vector_store = VectorStore("/test/path", "test-model", max_results=5)
+        first = store_mocks.store.search("decorators", course_name="python")
+        second = store_mocks.store.search("decorators", course_name="python")
         
-        # Perform search with custom limit
-        results = vector_store.search("test query", limit=10)
+        assert second is first
+        assert len(store_mocks.catalog.queries) == 1
+        assert len(store_mocks.content.queries) == 1
         
-        # Verify custom limit was used
-        mock_content.query.assert_called_once()
-        call_args = mock_content.query.call_args
-        assert call_args[1]['n_results'] == 10
+        # A different limit is a different search
+        store_mocks.store.search("decorators", course_name="python", limit=10)
+        assert len(store_mocks.content.queries) == 2
 
-    @patch('chromadb.PersistentClient')
-    @patch('chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
-    def test_search_error_handling(self, mock_embedding_func, mock_client_class):
-        """Test search error handling"""
-        # Setup mocks
-        mock_client = Mock()
-        mock_client_class.return_value = mock_client
-        
-        mock_catalog = Mock()
-        mock_content = Mock()
-        mock_content.query.side_effect = Exception("Database connection failed")
+    def test_search_cache_skips_errors(self, store_mocks):
+        """Test failed searches are retried rather than cached"""
+        store_mocks.content.error = Exception("Database connection failed")
+        store_mocks.store.search("test query")
         
-        mock_client.get_or_create_collection.side_effect = [mock_catalog, mock_content]
+        store_mocks.content.error = None
+        store_mocks.content.query_result = MockChromaResponse.successful_query_response()
+        results = store_mocks.store.search("test query")
         
-        vector_store = VectorStore("/test/path", "test-model")
+        assert results.error is None
+        assert len(store_mocks.content.queries) == 2
+
+    def test_search_cache_invalidated_on_add(self, store_mocks):
+        """Test adding course data drops cached search results"""
+        store_mocks.content.query_result = MockChromaResponse.successful_query_response()
+        store_mocks.store.search("test query")
         
-        # Perform search that will fail
-        results = vector_store.search("test query")
+        store_mocks.store.add_course_content(MockTestData.get_sample_course_chunks()[:1])
+        store_mocks.store.search("test query")
         
-        # Should return error results
-        assert results.error is not None
-        assert "Search error: Database connection failed" in results.error
+        assert len(store_mocks.content.queries) == 2
 
 
 class TestVectorStoreDataManagement:
     """Test data addition and management in VectorStore"""
     
-    @patch('chromadb.PersistentClient')
-    @patch('chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
-    def test_add_course_metadata(self, mock_embedding_func, mock_client_class):
+    def test_add_course_metadata(self, store_mocks):
         """Test adding course metadata to catalog"""
-        # Setup mocks
-        mock_client = Mock()
-        mock_client_class.return_value = mock_client
-        
-        mock_catalog = Mock()
-        mock_content = Mock()
-        
-        mock_client.get_or_create_collection.side_effect = [mock_catalog, mock_content]
-        
-        vector_store = VectorStore("/test/path", "test-model")
-        
         # Add course metadata
         sample_course = MockTestData.get_sample_courses()[0]
-        vector_store.add_course_metadata(sample_course)
+        store_mocks.store.add_course_metadata(sample_course)
         
         # Verify add was called correctly
-        mock_catalog.add.assert_called_once()
-        call_args = mock_catalog.add.call_args
+        [added] = store_mocks.catalog.adds
         
-        assert call_args[1]['documents'] == [sample_course.title]
-        assert call_args[1]['ids'] == [sample_course.title]
+        assert added['documents'] == [sample_course.title]
+        assert added['ids'] == [sample_course.title]
         
-        metadata = call_args[1]['metadatas'][0]
+        metadata = added['metadatas'][0]
         assert metadata['title'] == sample_course.title
         assert metadata['instructor'] == sample_course.instructor
         assert 'lessons_json' in metadata
-
-    @patch('chromadb.PersistentClient')
-    @patch('chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
-    def test_add_course_content(self, mock_embedding_func, mock_client_class):
+    
+    def test_add_course_content(self, store_mocks):
         """Test adding course content chunks"""
-        # Setup mocks
-        mock_client = Mock()
-        mock_client_class.return_value = mock_client
-        
-        mock_catalog = Mock()
-        mock_content = Mock()
-        
-        mock_client.get_or_create_collection.side_effect = [mock_catalog, mock_content]
-        
-        vector_store = VectorStore("/test/path", "test-model")
-        
         # Add course content
         sample_chunks = MockTestData.get_sample_course_chunks()[:2]
-        vector_store.add_course_content(sample_chunks)
+        store_mocks.store.add_course_content(sample_chunks)
         
         # Verify add was called correctly
-        mock_content.add.assert_called_once()
-        call_args = mock_content.add.call_args
+        [added] = store_mocks.content.upserts
         
-        assert len(call_args[1]['documents']) == 2
-        assert len(call_args[1]['metadatas']) == 2
-        assert len(call_args[1]['ids']) == 2
+        assert len(added['documents']) == 2
+        assert len(added['metadatas']) == 2
+        assert len(added['ids']) == 2
         
         # Check metadata structure
-        metadata = call_args[1]['metadatas'][0]
+        metadata = added['metadatas'][0]
         assert 'course_title' in metadata
         assert 'lesson_number' in metadata
         assert 'chunk_index' in metadata
-
-    @patch('chromadb.PersistentClient')
-    @patch('chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
-    def test_add_empty_course_content(self, mock_embedding_func, mock_client_class):
-        """Test adding empty course content list"""
-        # Setup mocks
-        mock_client = Mock()
-        mock_client_class.return_value = mock_client
-        
-        mock_catalog = Mock()
-        mock_content = Mock()
+    
+    def test_add_course_content_skips_unchanged_chunks(self, store_mocks):
+        """Test re-ingesting chunks only upserts those that are new or changed"""
+        first, second = MockTestData.get_sample_course_chunks()[:2]
+        first_id = f"{first.course_title.replace(' ', '_')}_{first.chunk_index}"
+        first_metadata = {"course_title": first.course_title, "lesson_number": 3, "chunk_index": 0}
+        store_mocks.content.get_result = {'ids': [first_id], 'documents': [first.content], 'metadatas': [first_metadata]}
+        
+        store_mocks.store.add_course_content([first, second])
+        
+        [lookup] = store_mocks.content.gets
+        assert lookup['include'] == ["documents", "metadatas"]
+        [upserted] = store_mocks.content.upserts
+        assert upserted['documents'] == [second.content]
+        
+        # Nothing changed at all: no upsert
+        second_metadata = {"course_title": second.course_title, "lesson_number": 3, "chunk_index": 1}
+        store_mocks.content.get_result = {
+            'ids': lookup['ids'],
+            'documents': [first.content, second.content],
+            'metadatas': [first_metadata, second_metadata]
+        }
+        store_mocks.store.add_course_content([first, second])
+        assert len(store_mocks.content.upserts) == 1
+    
+    def test_add_course_content_upserts_changed_metadata(self, store_mocks):
+        """Test a chunk with unchanged text but a moved lesson is upserted"""
+        chunk = MockTestData.get_sample_course_chunks()[0]
+        chunk_id = f"{chunk.course_title.replace(' ', '_')}_{chunk.chunk_index}"
+        store_mocks.content.get_result = {
+            'ids': [chunk_id],
+            'documents': [chunk.content],
+            'metadatas': [{"course_title": chunk.course_title, "lesson_number": 2, "chunk_index": 0}]
+        }
         
-        mock_client.get_or_create_collection.side_effect = [mock_catalog, mock_content]
+        store_mocks.store.add_course_content([chunk])
         
-        vector_store = VectorStore("/test/path", "test-model")
+        [upserted] = store_mocks.content.upserts
+        assert upserted['metadatas'] == [{"course_title": chunk.course_title, "lesson_number": 3, "chunk_index": 0}]
+    
+    def test_add_course_content_rejects_duplicate_ids(self, store_mocks):
+        """Test chunks that map to the same ID raise instead of one silently replacing the other"""
+        chunk = MockTestData.get_sample_course_chunks()[0]
         
-        # Add empty content
-        vector_store.add_course_content([])
+        with pytest.raises(ValueError, match="Duplicate chunk ID"):
+            store_mocks.store.add_course_content([chunk, chunk])
         
-        # Should not call add on content collection
-        mock_content.add.assert_not_called()
+        assert store_mocks.content.gets == []
+        assert store_mocks.content.upserts == []
 
-    @patch('chromadb.PersistentClient')
-    @patch('chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
-    def test_clear_all_data(self, mock_embedding_func, mock_client_class):
-        """Test clearing all data from collections"""
-        # Setup mocks
-        mock_client = Mock()
-        mock_client_class.return_value = mock_client
-        
-        mock_catalog = Mock()
-        mock_content = Mock()
+    def test_add_course_content_in_batches(self, store_mocks, monkeypatch):
+        """Test large chunk lists are upserted in CONTENT_BATCH_SIZE batches"""
+        monkeypatch.setattr(VectorStore, "CONTENT_BATCH_SIZE", 2)
+        chunks = [
+            CourseChunk(content=f"Chunk {index}", course_title="Test Course", lesson_number=1, chunk_index=index)
+            for index in range(5)
+        ]
         
-        mock_client.get_or_create_collection.side_effect = [mock_catalog, mock_content, mock_catalog, mock_content]
+        store_mocks.store.add_course_content(chunks)
         
-        vector_store = VectorStore("/test/path", "test-model")
+        assert [len(upserted['ids']) for upserted in store_mocks.content.upserts] == [2, 2, 1]
+        assert [len(lookup['ids']) for lookup in store_mocks.content.gets] == [2, 2, 1]
+
+    def test_add_empty_course_content(self, store_mocks):
+        """Test adding empty course content list"""
+        # Add empty content
+        store_mocks.store.add_course_content([])
         
+        # Should not call add on content collection
+        assert store_mocks.content.upserts == []
+    
+    def test_clear_all_data(self, store_mocks):
+        """Test clearing all data from collections"""
         # Clear all data
-        vector_store.clear_all_data()
+        store_mocks.store.clear_all_data()
         
         # Verify collections were deleted and recreated
-        assert mock_client.delete_collection.call_count == 2
-        delete_calls = [call[0][0] for call in mock_client.delete_collection.call_args_list]
+        assert store_mocks.client.delete_collection.call_count == 2
+        delete_calls = [call[0][0] for call in store_mocks.client.delete_collection.call_args_list]
         assert "course_catalog" in delete_calls
         assert "course_content" in delete_calls
+        assert store_mocks.client.get_or_create_collection.call_count == 2
 
 
 class TestVectorStoreUtilityMethods:
     """Test utility methods of VectorStore"""
     
-    @patch('chromadb.PersistentClient')
-    @patch('chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
-    def test_get_existing_course_titles(self, mock_embedding_func, mock_client_class):
+    def test_get_existing_course_titles(self, store_mocks):
         """Test retrieving existing course titles"""
-        # Setup mocks
-        mock_client = Mock()
-        mock_client_class.return_value = mock_client
-        
-        mock_catalog = Mock()
-        mock_catalog.get.return_value = {
+        store_mocks.catalog.get_result = {
             'ids': ['Course 1', 'Course 2', 'Course 3']
         }
-        mock_content = Mock()
-        
-        mock_client.get_or_create_collection.side_effect = [mock_catalog, mock_content]
-        
-        vector_store = VectorStore("/test/path", "test-model")
         
         # Get existing titles
-        titles = vector_store.get_existing_course_titles()
+        titles = store_mocks.store.get_existing_course_titles()
         
         assert titles == ['Course 1', 'Course 2', 'Course 3']
-        mock_catalog.get.assert_called_once()
-
-    @patch('chromadb.PersistentClient')
-    @patch('chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
-    def test_get_course_count(self, mock_embedding_func, mock_client_class):
-        """Test getting course count"""
-        # Setup mocks
-        mock_client = Mock()
-        mock_client_class.return_value = mock_client
-        
-        mock_catalog = Mock()
-        mock_catalog.get.return_value = {
-            'ids': ['Course 1', 'Course 2']
-        }
-        mock_content = Mock()
+        assert store_mocks.catalog.gets == [{"include": []}]
+    
+    def test_has_course_uses_cached_titles(self, store_mocks):
+        """Test course existence checks fetch the catalog IDs once, even across ingests"""
+        store_mocks.catalog.get_result = {'ids': ['Course 1']}
+        sample_course = MockTestData.get_sample_courses()[0]
         
-        mock_client.get_or_create_collection.side_effect = [mock_catalog, mock_content]
+        assert store_mocks.store.has_course('Course 1')
+        assert not store_mocks.store.has_course(sample_course.title)
+        store_mocks.store.add_course_metadata(sample_course)
+        assert store_mocks.store.has_course(sample_course.title)
         
-        vector_store = VectorStore("/test/path", "test-model")
+        assert store_mocks.catalog.gets == [{"include": []}]
+    
+    def test_get_course_count(self, store_mocks):
+        """Test getting course count"""
+        store_mocks.catalog.count_result = 2
         
         # Get course count
-        count = vector_store.get_course_count()
+        count = store_mocks.store.get_course_count()
         
         assert count == 2
-        mock_catalog.get.assert_called_once()
-
-    @patch('chromadb.PersistentClient')
-    @patch('chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
-    def test_get_lesson_link(self, mock_embedding_func, mock_client_class):
+        assert store_mocks.catalog.count_calls == 1
+        assert store_mocks.catalog.gets == []
+    
+    def test_get_lesson_link(self, store_mocks):
         """Test retrieving lesson link for specific course and lesson"""
-        # Setup mocks
-        mock_client = Mock()
-        mock_client_class.return_value = mock_client
-        
-        mock_catalog = Mock()
         lessons_data = [
             {"lesson_number": 1, "title": "Intro", "lesson_link": "https://example.com/lesson1"},
             {"lesson_number": 3, "title": "Advanced", "lesson_link": "https://example.com/lesson3"}
         ]
-        mock_catalog.get.return_value = {
+        store_mocks.catalog.get_result = {
             'metadatas': [{
                 'lessons_json': json.dumps(lessons_data)
             }]
         }
-        mock_content = Mock()
-        
-        mock_client.get_or_create_collection.side_effect = [mock_catalog, mock_content]
-        
-        vector_store = VectorStore("/test/path", "test-model")
         
         # Get lesson link
-        link = vector_store.get_lesson_link("Test Course", 3)
+        link = store_mocks.store.get_lesson_link("Test Course", 3)
         
         assert link == "https://example.com/lesson3"
-        mock_catalog.get.assert_called_once_with(ids=["Test Course"])
-
-    @patch('chromadb.PersistentClient')
-    @patch('chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction')
-    def test_get_lesson_link_not_found(self, mock_embedding_func, mock_client_class):
+        assert store_mocks.catalog.gets == [{"ids": ["Test Course"]}]
+    
+    def test_get_lesson_link_not_found(self, store_mocks):
         """Test retrieving lesson link when lesson doesn't exist"""
-        # Setup mocks
-        mock_client = Mock()
-        mock_client_class.return_value = mock_client
-        
-        mock_catalog = Mock()
         lessons_data = [
             {"lesson_number": 1, "title": "Intro", "lesson_link": "https://example.com/lesson1"}
         ]
-        mock_catalog.get.return_value = {
+        store_mocks.catalog.get_result = {
             'metadatas': [{
                 'lessons_json': json.dumps(lessons_data)
             }]
         }
-        mock_content = Mock()
         
-        mock_client.get_or_create_collection.side_effect = [mock_catalog, mock_content]
+        # Get link for non-existent lesson
+        link = store_mocks.store.get_lesson_link("Test Course", 99)
         
-        vector_store = VectorStore("/test/path", "test-model")
+        assert link is None
+
+    def test_get_lesson_link_cached(self, store_mocks):
+        """Test lesson links are decoded once per course until its metadata changes"""
+        lessons_data = [
+            {"lesson_number": 1, "title": "Intro", "lesson_link": "https://example.com/lesson1"},
+            {"lesson_number": 3, "title": "Advanced", "lesson_link": "https://example.com/lesson3"}
+        ]
+        store_mocks.catalog.get_result = {
+            'metadatas': [{
+                'lessons_json': json.dumps(lessons_data)
+            }]
+        }
         
-        # Get link for non-existent lesson
-        link = vector_store.get_lesson_link("Test Course", 99)
+        assert store_mocks.store.get_lesson_link("Test Course", 1) == "https://example.com/lesson1"
+        assert store_mocks.store.get_lesson_link("Test Course", 3) == "https://example.com/lesson3"
+        assert len(store_mocks.catalog.gets) == 1
         
-        assert link is None
\ No newline at end of file
+        # Re-adding the course drops its cached links
+        course = MockTestData.get_sample_courses()[0]
+        store_mocks.store.add_course_metadata(course.model_copy(update={"title": "Test Course"}))
+        store_mocks.store.get_lesson_link("Test Course", 1)
+        assert len(store_mocks.catalog.gets) == 2
\ No newline at end of file
@@ -1,9 +1,32 @@
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import chromadb
 from chromadb.config import Settings
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from dataclasses import dataclass
 from models import Course, CourseChunk
-from sentence_transformers import SentenceTransformer
+
+# orjson ships with chromadb; fall back to the stdlib if it is ever missing
+try:
+    import orjson
+    _json_loads = orjson.loads
+
+    def _json_dumps(value: Any) -> str:
+        return orjson.dumps(value).decode()
+except ImportError:
+    import json
+    _json_loads = json.loads
+    _json_dumps = json.dumps
+
+
+@functools.lru_cache(maxsize=4)
+def _get_embedding_function(model_name: str):
+    """Shared embedding function per model so stores load the model weights once per process"""
+    return chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction(
+        model_name=model_name
+    )
 
 @dataclass
 class SearchResults:
@@ -14,12 +37,12 @@ class SearchResults:
     error: Optional[str] = None
     
     @classmethod
-    def from_chroma(cls, chroma_results: Dict) -> 'SearchResults':
-        """Create SearchResults from ChromaDB query results"""
+    def from_chroma(cls, chroma_results: Dict, index: int = 0) -> 'SearchResults':
+        """Create SearchResults from ChromaDB query results for the query at index"""
         return cls(
-            documents=chroma_results['documents'][0] if chroma_results['documents'] else [],
-            metadata=chroma_results['metadatas'][0] if chroma_results['metadatas'] else [],
-            distances=chroma_results['distances'][0] if chroma_results['distances'] else []
+            documents=chroma_results['documents'][index] if chroma_results['documents'] else [],
+            metadata=chroma_results['metadatas'][index] if chroma_results['metadatas'] else [],
+            distances=chroma_results['distances'][index] if chroma_results['distances'] else []
         )
     
     @classmethod
@@ -30,12 +53,37 @@ class SearchResults:
     def is_empty(self) -> bool:
         """Check if results are empty"""
         return len(self.documents) == 0
+    
+    def iter_results(self) -> Iterator[Tuple[str, Dict[str, Any], float]]:
+        """Yield (document, metadata, distance) per hit without building an intermediate list"""
+        yield from zip(self.documents, self.metadata, self.distances)
 
 class VectorStore:
     """Vector storage using ChromaDB for course content and metadata"""
     
+    # Maximum number of searches kept in the exact-match result cache
+    SEARCH_CACHE_SIZE = 1000
+    
+    # Chunks looked up and upserted per ChromaDB call, well under its maximum batch size
+    CONTENT_BATCH_SIZE = 1000
+    
+    # Embeds queries while a course name filter resolves against the catalog; shared by all stores
+    _executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="vector-store")
+    
     def __init__(self, chroma_path: str, embedding_model: str, max_results: int = 5):
         self.max_results = max_results
+        
+        # Search results keyed by query, filters and limit, oldest first; cleared when data changes.
+        # Searches run on worker threads (ToolManager.aexecute_tool), hence the lock
+        self._search_cache: "OrderedDict[Tuple[str, Optional[str], Optional[int], int], SearchResults]" = OrderedDict()
+        self._search_cache_lock = threading.Lock()
+        
+        # Lesson number -> lesson link per course title, decoded from the catalog's lessons JSON
+        self._lesson_links_cache: Dict[str, Dict[int, Optional[str]]] = {}
+        
+        # Course titles for matching course names without a catalog query; loaded on first use
+        self._course_titles: Optional[List[str]] = None
+        
         # Initialize ChromaDB client
         self.client = chromadb.PersistentClient(
             path=chroma_path,
@@ -43,9 +91,7 @@ class VectorStore:
         )
         
         # Set up sentence transformer embedding function
-        self.embedding_function = chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name=embedding_model
-        )
+        self.embedding_function = _get_embedding_function(embedding_model)
         
         # Create collections for different types of data
         self.course_catalog = self._create_collection("course_catalog")  # Course titles/instructors
@@ -75,32 +121,98 @@ class VectorStore:
         Returns:
             SearchResults object with documents and metadata
         """
+        return self.batch_search([query], course_name, lesson_number, limit)[0]
+    
+    def batch_search(self,
+                     queries: List[str],
+                     course_name: Optional[str] = None,
+                     lesson_number: Optional[int] = None,
+                     limit: Optional[int] = None) -> List[SearchResults]:
+        """
+        Search course content for several queries with a single ChromaDB query.
+        
+        Args:
+            queries: What to search for in course content
+            course_name: Optional course name/title to filter every query by
+            lesson_number: Optional lesson number to filter every query by
+            limit: Maximum results to return per query
+            
+        Returns:
+            One SearchResults object per query, in the same order
+        """
+        # Use provided limit or fall back to configured max_results
+        search_limit = limit if limit is not None else self.max_results
+        
+        # Repeated searches skip course resolution and the content query
+        keys = [(query, course_name, lesson_number, search_limit) for query in queries]
+        found = {key: self._cached_search(key) for key in keys}
+        misses = [key for key, cached in found.items() if cached is None]
+        if not misses:
+            return [found[key] for key in keys]
+        
+        # Embed the queries while the course name resolves rather than after it
+        query_texts = [key[0] for key in misses]
+        embedding = self._executor.submit(self.embedding_function, query_texts) if course_name else None
+        
         # Step 1: Resolve course name if provided
         course_title = None
         if course_name:
             course_title = self._resolve_course_name(course_name)
             if not course_title:
-                return SearchResults.empty(f"No course found matching '{course_name}'")
+                return [found[key] or SearchResults.empty(f"No course found matching '{course_name}'")
+                        for key in keys]
         
         # Step 2: Build filter for content search
         filter_dict = self._build_filter(course_title, lesson_number)
         
-        # Step 3: Search course content
-        # Use provided limit or fall back to configured max_results
-        search_limit = limit if limit is not None else self.max_results
-        
+        # Step 3: Search course content for every uncached query at once
         try:
+            if embedding is not None:
+                query = {"query_embeddings": embedding.result()}
+            else:
+                query = {"query_texts": query_texts}
             results = self.course_content.query(
-                query_texts=[query],
+                **query,
                 n_results=search_limit,
                 where=filter_dict
             )
-            return SearchResults.from_chroma(results)
         except Exception as e:
-            return SearchResults.empty(f"Search error: {str(e)}")
+            return [found[key] or SearchResults.empty(f"Search error: {str(e)}") for key in keys]
+        
+        # Only successful searches are cached so transient errors are retried
+        for index, key in enumerate(misses):
+            found[key] = SearchResults.from_chroma(results, index)
+            self._store_search(key, found[key])
+        return [found[key] for key in keys]
+    
+    def _cached_search(self, key: Tuple[str, Optional[str], Optional[int], int]) -> Optional[SearchResults]:
+        """Return cached search results and mark them recently used"""
+        with self._search_cache_lock:
+            cached = self._search_cache.get(key)
+            if cached is not None:
+                self._search_cache.move_to_end(key)
+            return cached
+    
+    def _store_search(self, key: Tuple[str, Optional[str], Optional[int], int], results: SearchResults):
+        """Cache search results, evicting the oldest beyond SEARCH_CACHE_SIZE"""
+        with self._search_cache_lock:
+            self._search_cache[key] = results
+            while len(self._search_cache) > self.SEARCH_CACHE_SIZE:
+                self._search_cache.popitem(last=False)
+    
+    def clear_caches(self):
+        """Drop cached search results, lesson links and course titles, e.g. after the stored course data changed"""
+        with self._search_cache_lock:
+            self._search_cache.clear()
+        self._lesson_links_cache.clear()
+        self._course_titles = None
     
     def _resolve_course_name(self, course_name: str) -> Optional[str]:
-        """Use vector search to find best matching course by name"""
+        """Find the best matching course title by name, falling back to vector search"""
+        course_title = self._match_course_title(course_name)
+        if course_title:
+            return course_title
+        
         try:
             results = self.course_catalog.query(
                 query_texts=[course_name],
@@ -115,6 +227,29 @@ class VectorStore:
         
         return None
     
+    def _get_course_titles(self) -> List[str]:
+        """Stored course titles, fetched from the catalog on first use and cached until data changes"""
+        if self._course_titles is None:
+            self._course_titles = self.get_existing_course_titles()
+        return self._course_titles
+    
+    def has_course(self, course_title: str) -> bool:
+        """Check whether a course is already stored, without a catalog round-trip once titles are cached"""
+        return course_title in self._get_course_titles()
+    
+    def _match_course_title(self, course_name: str) -> Optional[str]:
+        """Match a course name against the stored titles as an exact or unique partial title, ignoring case"""
+        name = course_name.strip().casefold()
+        # An empty name is a substring of every title, so it can't pick one
+        if not name:
+            return None
+        matches = [title for title in self._get_course_titles() if name in title.casefold()]
+        for title in matches:
+            if title.casefold() == name:
+                return title
+        # Ambiguous or paraphrased names are left to the embedding search
+        return matches[0] if len(matches) == 1 else None
+    
     def _build_filter(self, course_title: Optional[str], lesson_number: Optional[int]) -> Optional[Dict]:
         """Build ChromaDB filter from search parameters"""
         if not course_title and lesson_number is None:
@@ -134,8 +269,6 @@ class VectorStore:
     
     def add_course_metadata(self, course: Course):
         """Add course information to the catalog for semantic search"""
-        import json
-
         course_text = course.title
         
         # Build lessons metadata and serialize as JSON string
@@ -153,31 +286,58 @@ class VectorStore:
                 "title": course.title,
                 "instructor": course.instructor,
                 "course_link": course.course_link,
-                "lessons_json": json.dumps(lessons_metadata),  # Serialize as JSON string
+                "lessons_json": _json_dumps(lessons_metadata),  # Serialize as JSON string
                 "lesson_count": len(course.lessons)
             }],
             ids=[course.title]
         )
+        course_titles = self._course_titles
+        self.clear_caches()
+        # The catalog only gained this title, so keep already-loaded titles warm during ingest
+        if course_titles is not None and course.title not in course_titles:
+            self._course_titles = course_titles + [course.title]
     
     def add_course_content(self, chunks: List[CourseChunk]):
-        """Add course content chunks to the vector store"""
+        """Add course content chunks, from one or many courses, to the vector store"""
         if not chunks:
             return
         
-        documents = [chunk.content for chunk in chunks]
-        metadatas = [{
-            "course_title": chunk.course_title,
-            "lesson_number": chunk.lesson_number,
-            "chunk_index": chunk.chunk_index
-        } for chunk in chunks]
-        # Use title with chunk index for unique IDs
-        ids = [f"{chunk.course_title.replace(' ', '_')}_{chunk.chunk_index}" for chunk in chunks]
+        # Use title with chunk index for unique IDs, paired with the document and metadata to store
+        entries: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        for chunk in chunks:
+            chunk_id = f"{chunk.course_title.replace(' ', '_')}_{chunk.chunk_index}"
+            if chunk_id in entries:
+                raise ValueError(f"Duplicate chunk ID '{chunk_id}': chunk indexes must be unique per course")
+            entries[chunk_id] = (chunk.content, {
+                "course_title": chunk.course_title,
+                "lesson_number": chunk.lesson_number,
+                "chunk_index": chunk.chunk_index
+            })
+        all_ids = list(entries)
         
-        self.course_content.add(
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids
-        )
+        changed = False
+        for start in range(0, len(all_ids), self.CONTENT_BATCH_SIZE):
+            batch_ids = all_ids[start:start + self.CONTENT_BATCH_SIZE]
+            
+            # Skip re-ingested chunks whose stored text and metadata are unchanged so they aren't embedded again
+            existing = self.course_content.get(ids=batch_ids, include=["documents", "metadatas"])
+            stored = {
+                chunk_id: (document, metadata)
+                for chunk_id, document, metadata in zip(existing['ids'], existing['documents'], existing['metadatas'])
+            } if existing else {}
+            ids = [chunk_id for chunk_id in batch_ids if stored.get(chunk_id) != entries[chunk_id]]
+            if not ids:
+                continue
+            
+            self.course_content.upsert(
+                documents=[entries[chunk_id][0] for chunk_id in ids],
+                metadatas=[entries[chunk_id][1] for chunk_id in ids],
+                ids=ids
+            )
+            changed = True
+        
+        if changed:
+            self.clear_caches()
     
     def clear_all_data(self):
         """Clear all data from both collections"""
@@ -189,12 +349,13 @@ class VectorStore:
             self.course_content = self._create_collection("course_content")
         except Exception as e:
             print(f"Error clearing data: {e}")
+        self.clear_caches()
     
     def get_existing_course_titles(self) -> List[str]:
         """Get all existing course titles from the vector store"""
         try:
-            # Get all documents from the catalog
-            results = self.course_catalog.get()
+            # Titles are the catalog IDs, so skip fetching documents and metadata
+            results = self.course_catalog.get(include=[])
             if results and 'ids' in results:
                 return results['ids']
             return []
@@ -205,17 +366,14 @@ class VectorStore:
     def get_course_count(self) -> int:
         """Get the total number of courses in the vector store"""
         try:
-            results = self.course_catalog.get()
-            if results and 'ids' in results:
-                return len(results['ids'])
-            return 0
+            # Counted by ChromaDB instead of transferring every ID
+            return self.course_catalog.count()
         except Exception as e:
             print(f"Error getting course count: {e}")
             return 0
     
     def get_all_courses_metadata(self) -> List[Dict[str, Any]]:
         """Get metadata for all courses in the vector store"""
-        import json
         try:
             results = self.course_catalog.get()
             if results and 'metadatas' in results:
@@ -224,7 +382,7 @@ class VectorStore:
                 for metadata in results['metadatas']:
                     course_meta = metadata.copy()
                     if 'lessons_json' in course_meta:
-                        course_meta['lessons'] = json.loads(course_meta['lessons_json'])
+                        course_meta['lessons'] = _json_loads(course_meta['lessons_json'])
                         del course_meta['lessons_json']  # Remove the JSON string version
                     parsed_metadata.append(course_meta)
                 return parsed_metadata
@@ -248,7 +406,10 @@ class VectorStore:
     
     def get_lesson_link(self, course_title: str, lesson_number: int) -> Optional[str]:
         """Get lesson link for a given course title and lesson number"""
-        import json
+        # Decoded once per course until clear_caches runs on a data change
+        lesson_links = self._lesson_links_cache.get(course_title)
+        if lesson_links is not None:
+            return lesson_links.get(lesson_number)
         try:
             # Get course by ID (title is the ID)
             results = self.course_catalog.get(ids=[course_title])
@@ -256,11 +417,12 @@ class VectorStore:
                 metadata = results['metadatas'][0]
                 lessons_json = metadata.get('lessons_json')
                 if lessons_json:
-                    lessons = json.loads(lessons_json)
-                    # Find the lesson with matching number
-                    for lesson in lessons:
-                        if lesson.get('lesson_number') == lesson_number:
-                            return lesson.get('lesson_link')
+                    lesson_links = {
+                        lesson.get('lesson_number'): lesson.get('lesson_link')
+                        for lesson in _json_loads(lessons_json)
+                    }
+                    self._lesson_links_cache[course_title] = lesson_links
+                    return lesson_links.get(lesson_number)
             return None
         except Exception as e:
             print(f"Error getting lesson link: {e}")